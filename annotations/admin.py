@@ -1,6 +1,123 @@
-from django.contrib import admin
-from .models import Image, Comment
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.utils.functional import cached_property
 
-# Register your models here.
-admin.site.register(Image)
-admin.site.register(Comment)
+from .models import Annotation, Image, Comment, moderate_annotations
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the database's row estimate for large tables.
+
+    An exact ``COUNT(*)`` is a full scan, so for unfiltered changelists the
+    planner statistics are used instead once they report at least
+    ``threshold`` rows. Filtered lists and small tables are counted exactly.
+    """
+
+    threshold = 100000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = self.estimate(self.object_list)
+            if estimate is not None and estimate >= self.threshold:
+                return estimate
+        return super().count
+
+    def estimate(self, queryset):
+        connection = connections[queryset.db]
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [table]
+                )
+            elif connection.vendor == "sqlite":
+                # Filled in by ANALYZE, every row starts with the table size
+                if "sqlite_stat1" not in connection.introspection.table_names(cursor):
+                    return None
+                cursor.execute(
+                    "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]
+                )
+            else:
+                return None
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return int(float(str(row[0]).split()[0]))
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) on filtered changelists
+    show_full_result_count = False
+
+
+class AnnotationListFilter(admin.SimpleListFilter):
+    """
+    Filter images by annotation with an ``EXISTS`` on the M2M through table.
+
+    Filtering on ``annotation__annotation`` joins through the M2M table, which
+    makes the changelist add ``DISTINCT`` and count exactly. The subquery is
+    answered from the through table's ``(image_id, annotation_id)`` index.
+    """
+
+    title = "annotation"
+    parameter_name = "annotation"
+
+    def lookups(self, request, model_admin):
+        return Annotation.objects.order_by("annotation").values_list("pk", "annotation")
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        through = Image.annotation.through
+        return queryset.filter(
+            Exists(
+                through.objects.filter(
+                    image_id=OuterRef("pk"), annotation_id=self.value()
+                )
+            )
+        )
+
+
+def moderation_action(value, label, add):
+    verb = "Add" if add else "Remove"
+
+    @admin.action(
+        description=f"{verb} the {label.lower()} annotation",
+        permissions=["change"],
+    )
+    def action(modeladmin, request, queryset):
+        kwargs = {"add": [value]} if add else {"remove": [value]}
+        image_ids = moderate_annotations(queryset.values("pk"), **kwargs)
+        modeladmin.message_user(
+            request, f"Updated {len(image_ids)} images.", messages.SUCCESS
+        )
+
+    action.__name__ = f"{verb.lower()}_{value}_annotation"
+    return action
+
+
+@admin.register(Image)
+class ImageAdmin(LargeTableAdmin):
+    list_display = ["id", "image", "user", "status"]
+    list_select_related = ["user"]
+    list_filter = ["status", AnnotationListFilter]
+    autocomplete_fields = ["user"]
+    actions = [
+        moderation_action(value, label, add)
+        for add in (True, False)
+        for value, label in Annotation.EXISTING_ANNOTATIONS
+    ]
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ["id", "image_id", "user", "text"]
+    list_select_related = ["user"]
+    autocomplete_fields = ["user"]
+    raw_id_fields = ["image"]
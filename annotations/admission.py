@@ -0,0 +1,227 @@
+import math
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+from .models import Image
+
+DEFAULTS = {
+    "STORE_PATH": settings.BASE_DIR / "admission.sqlite3",
+    "USER_RATE": "60/min",
+    "USER_BURST": 10,
+    "GLOBAL_RATE": "600/min",
+    "GLOBAL_BURST": 100,
+    "MAX_QUEUED": 1000,
+    "MAX_QUEUED_PER_USER": 100,
+    "QUEUE_RETRY_AFTER": 30,
+    "PRUNE_INTERVAL": 300,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, "UPLOAD_ADMISSION", {})}
+
+
+class TokenBucketStore:
+    """
+    Token buckets kept in a small SQLite file.
+
+    Every worker process on the host opens the same file, and updates run
+    in ``BEGIN IMMEDIATE`` transactions, so the limits are shared and
+    enforced atomically across processes.
+    """
+
+    _local = threading.local()
+
+    def __init__(self, path, clock=time.time):
+        self.path = str(path)
+        self.clock = clock
+
+    @property
+    def connection(self):
+        # One connection per thread and file, reused across requests
+        if not hasattr(self._local, "connections"):
+            self._local.connections = {}
+        connections = self._local.connections
+        if self.path not in connections:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bucket "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            connections[self.path] = connection
+        return connections[self.path]
+
+    def take(self, buckets):
+        """
+        Take one token from each of ``buckets`` or from none of them.
+
+        ``buckets`` is a list of ``(key, rate, capacity)``, with ``rate`` in
+        tokens per second. Returns 0 when the tokens were taken, otherwise
+        the number of seconds until all buckets have a token again.
+        """
+        now = self.clock()
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, rate, capacity in buckets:
+                row = connection.execute(
+                    "SELECT tokens, updated FROM bucket WHERE key = ?", [key]
+                ).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels.append((key, rate, tokens))
+
+            wait = max(
+                ((1 - tokens) / rate for _, rate, tokens in levels if tokens < 1),
+                default=0,
+            )
+            if not wait:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO bucket (key, tokens, updated) "
+                    "VALUES (?, ?, ?)",
+                    [(key, tokens - 1, now) for key, _, tokens in levels],
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    def give(self, buckets):
+        """
+        Put one token back into each of ``buckets``, e.g. for an upload that
+        was rejected as invalid after it was admitted.
+        """
+        now = self.clock()
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for key, rate, capacity in buckets:
+                row = connection.execute(
+                    "SELECT tokens, updated FROM bucket WHERE key = ?", [key]
+                ).fetchone()
+                if row is None:
+                    # Missing buckets are full
+                    continue
+                tokens, updated = row
+                tokens = min(capacity, tokens + (now - updated) * rate + 1)
+                connection.execute(
+                    "UPDATE bucket SET tokens = ?, updated = ? WHERE key = ?",
+                    [tokens, now, key],
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def prune(self, max_age):
+        """
+        Delete the buckets untouched for ``max_age`` seconds.
+
+        With ``max_age`` at least the time a bucket takes to refill they are
+        full again, which is what a missing bucket counts as.
+        """
+        self.connection.execute(
+            "DELETE FROM bucket WHERE updated <= ?", [self.clock() - max_age]
+        )
+
+    def clear(self):
+        self.connection.execute("DELETE FROM bucket")
+
+
+def parse_rate(rate):
+    """
+    Turn a DRF style rate such as ``"60/min"`` into tokens per second.
+    """
+    num, period = rate.split("/")
+    duration = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+    return int(num) / duration
+
+
+class UploadRateThrottle(BaseThrottle):
+    """
+    Per-user and global token bucket limits on uploads.
+
+    Both buckets must have a token for the upload to be admitted, and a
+    rejected upload takes none. Uploads that turn out to be invalid get
+    their tokens back through ``refund``.
+    """
+
+    # When this process last pruned the store, see allow_request
+    pruned = 0
+
+    def get_buckets(self, config, request):
+        return [
+            (
+                f"upload:user:{request.user.pk}",
+                parse_rate(config["USER_RATE"]),
+                config["USER_BURST"],
+            ),
+            (
+                "upload:global",
+                parse_rate(config["GLOBAL_RATE"]),
+                config["GLOBAL_BURST"],
+            ),
+        ]
+
+    def allow_request(self, request, view):
+        config = get_config()
+        store = TokenBucketStore(config["STORE_PATH"])
+        buckets = self.get_buckets(config, request)
+        self.wait_seconds = store.take(buckets)
+        request.upload_admitted = not self.wait_seconds
+
+        # Every user gets a bucket, drop those that have refilled since
+        now = time.monotonic()
+        if now - UploadRateThrottle.pruned >= config["PRUNE_INTERVAL"]:
+            UploadRateThrottle.pruned = now
+            store.prune(max(capacity / rate for _, rate, capacity in buckets))
+        return not self.wait_seconds
+
+    def refund(self, request):
+        """
+        Give back the tokens taken by ``request``, if it was admitted.
+        """
+        if getattr(request, "upload_admitted", False):
+            config = get_config()
+            store = TokenBucketStore(config["STORE_PATH"])
+            store.give(self.get_buckets(config, request))
+            request.upload_admitted = False
+
+    def wait(self):
+        return math.ceil(self.wait_seconds)
+
+
+class AnnotationBacklogFull(APIException):
+    status_code = 503
+    default_detail = "Too many images are waiting for annotation, try again later."
+    default_code = "annotation_backlog_full"
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        # Picked up by DRF's exception handler for the Retry-After header
+        self.wait = wait
+
+
+def check_annotation_backlog(user):
+    """
+    Raise ``AnnotationBacklogFull`` when too many images are queued.
+
+    The counts stop at the threshold, so a large backlog costs no more to
+    check than a full one.
+    """
+    config = get_config()
+    queued = Image.objects.filter(status="queued").values("pk")
+    limits = [
+        (queued, config["MAX_QUEUED"]),
+        (queued.filter(user=user), config["MAX_QUEUED_PER_USER"]),
+    ]
+    for queryset, limit in limits:
+        if limit is not None and queryset[:limit].count() >= limit:
+            raise AnnotationBacklogFull(config["QUEUE_RETRY_AFTER"])
@@ -0,0 +1,247 @@
+import logging
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from PIL import Image as PILImage
+
+from .models import Annotation, Image, annotate_images
+
+logger = logging.getLogger(__name__)
+
+
+class BaseAnnotator:
+    """
+    Turns images into annotation values, one batch at a time.
+
+    Subclasses implement ``annotate_batch``, which returns a dict mapping each
+    image id to the list of annotation values found for it. An empty list
+    means the image could not be annotated.
+
+    Annotators with ``inline`` set run as soon as an image is uploaded. Others
+    leave new images queued for ``annotate_queued_images``.
+    """
+
+    inline = False
+
+    def __init__(self, batch_size=32):
+        self.batch_size = batch_size
+
+    def annotate(self, images):
+        results = {}
+        for start in range(0, len(images), self.batch_size):
+            batch = images[start : start + self.batch_size]
+            began = time.perf_counter()
+            results.update(self.annotate_batch(batch))
+            elapsed = time.perf_counter() - began
+            logger.info(
+                "%s annotated %d images in %.3fs (%.1f images/s)",
+                type(self).__name__,
+                len(batch),
+                elapsed,
+                len(batch) / elapsed if elapsed else float("inf"),
+            )
+        return results
+
+    def annotate_batch(self, images):
+        raise NotImplementedError
+
+
+class RandomAnnotator(BaseAnnotator):
+    """
+    Picks a random annotation for every image after a simulated wait.
+    """
+
+    inline = True
+
+    def __init__(self, min_sleep=5, max_sleep=50, **kwargs):
+        super().__init__(**kwargs)
+        self.min_sleep = min_sleep
+        self.max_sleep = max_sleep
+
+    def annotate_batch(self, images):
+        # random wait time(sleep)
+        sleep_time = random.randint(self.min_sleep, self.max_sleep)
+        time.sleep(sleep_time)
+
+        # pick a random annotation for each image
+        return {
+            image.pk: [random.choice(Annotation.EXISTING_ANNOTATIONS)[0]]
+            for image in images
+        }
+
+
+# Typical colours of each annotation, used to build the default centroids
+PROTOTYPE_COLOURS = {
+    "boat": [(235, 235, 230), (200, 40, 40), (30, 90, 150), (120, 80, 50)],
+    "mountain": [(120, 110, 100), (160, 150, 140), (235, 235, 240), (140, 170, 210)],
+    "plains": [(190, 180, 90), (150, 170, 70), (210, 190, 120), (150, 190, 230)],
+    "ocean": [(20, 60, 120), (40, 100, 160), (70, 140, 190), (150, 190, 230)],
+    "forest": [(30, 70, 30), (50, 100, 40), (80, 120, 50), (40, 50, 30)],
+}
+
+
+def colour_features(pixels, bins=4):
+    """
+    Features of an ``(n, 3)`` uint8 pixel array.
+
+    A normalised joint RGB histogram followed by the mean colour, which
+    separates palettes whose histograms overlap equally.
+    """
+    quantised = (pixels.astype(np.uint16) * bins) >> 8
+    index = (quantised[:, 0] * bins + quantised[:, 1]) * bins + quantised[:, 2]
+    histogram = np.bincount(index, minlength=bins**3).astype(np.float32)
+    histogram /= max(len(pixels), 1)
+    mean = pixels.mean(axis=0, dtype=np.float32) / 255
+    return np.concatenate([histogram, mean])
+
+
+def extract_features(path, size=64, bins=4):
+    """
+    Decode and downsample the image at ``path`` and return its features.
+
+    Runs in the worker processes, so it only takes and returns picklable
+    values. Returns ``None`` when the image can't be read.
+    """
+    try:
+        with PILImage.open(path) as img:
+            # Let the JPEG decoder downscale while decoding
+            img.draft("RGB", (size, size))
+            img = img.convert("RGB")
+            img.thumbnail((size, size))
+            pixels = np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+    except Exception:
+        # Any unreadable file only fails its own image, not the batch
+        return None
+    return colour_features(pixels, bins)
+
+
+def image_path(image):
+    """
+    Return the local path of ``image``'s file, or ``None`` when it has no
+    file or its storage has no local paths.
+    """
+    try:
+        return image.image.path
+    except (ValueError, NotImplementedError):
+        return None
+
+
+class HistogramAnnotator(BaseAnnotator):
+    """
+    Nearest-centroid classifier over colour histograms.
+
+    Images are decoded, downsampled and turned into features in a process
+    pool, then each image gets the annotation whose centroid is closest.
+    ``centroids`` may point to an ``.npz`` file holding one array per
+    annotation value; by default they are built from ``PROTOTYPE_COLOURS``.
+    """
+
+    def __init__(self, workers=None, size=64, bins=4, centroids=None, **kwargs):
+        super().__init__(**kwargs)
+        self.workers = workers
+        self.size = size
+        self.bins = bins
+        self.labels, self.centroids = self.load_centroids(centroids)
+        self._executor = None
+
+    def load_centroids(self, path):
+        if path:
+            with np.load(path) as data:
+                centroids = {label: data[label] for label in data.files}
+        else:
+            centroids = {
+                label: colour_features(np.array(colours, dtype=np.uint8), self.bins)
+                for label, colours in PROTOTYPE_COLOURS.items()
+            }
+        labels = [label for label, _ in Annotation.EXISTING_ANNOTATIONS]
+        return labels, np.stack([centroids[label] for label in labels])
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def features(self, paths):
+        sizes = [self.size] * len(paths)
+        bins = [self.bins] * len(paths)
+        if self.workers == 0:
+            return list(map(extract_features, paths, sizes, bins))
+        return list(self.executor.map(extract_features, paths, sizes, bins))
+
+    def annotate_batch(self, images):
+        paths = [image_path(image) for image in images]
+        readable = [(image, path) for image, path in zip(images, paths) if path]
+        features = self.features([path for _, path in readable])
+
+        results = {image.pk: [] for image in images}
+        found = [
+            (image, f) for (image, _), f in zip(readable, features) if f is not None
+        ]
+        if found:
+            matrix = np.stack([f for _, f in found])
+            distances = np.linalg.norm(
+                matrix[:, None, :] - self.centroids[None, :, :], axis=2
+            )
+            for (image, _), nearest in zip(found, distances.argmin(axis=1)):
+                results[image.pk] = [self.labels[nearest]]
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_annotator = None
+
+
+def get_annotator():
+    """
+    Return the annotator configured in ``settings.ANNOTATION_BACKEND``.
+    """
+    global _annotator
+    if _annotator is None:
+        config = getattr(settings, "ANNOTATION_BACKEND", {})
+        backend = import_string(
+            config.get("BACKEND", "annotations.annotators.RandomAnnotator")
+        )
+        _annotator = backend(**config.get("OPTIONS", {}))
+    return _annotator
+
+
+def annotate_queued_images(batch_size=None, limit=None):
+    """
+    Annotate the queued images with the configured annotator.
+
+    Images are fetched and annotated ``batch_size`` at a time, by default the
+    annotator's own batch size, oldest first. Returns the number of images
+    processed.
+    """
+    batch_size = batch_size or get_annotator().batch_size
+    queued = Image.objects.filter(status="queued").order_by("pk")
+    processed = last = 0
+    while limit is None or processed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - processed)
+        batch = list(queued.filter(pk__gt=last)[:size])
+        if not batch:
+            break
+        last = batch[-1].pk
+        annotate_images(batch)
+        processed += len(batch)
+    return processed
+
+
+@receiver(setting_changed)
+def reset_annotator(setting, **kwargs):
+    global _annotator
+    if setting == "ANNOTATION_BACKEND":
+        if hasattr(_annotator, "close"):
+            _annotator.close()
+        _annotator = None
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AnnotationsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "annotations"
+
+    def ready(self):
+        # Connect the signal handlers that keep the rollups and counters up to date
+        from . import rollups, stats  # noqa: F401
@@ -0,0 +1,130 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Keeps hit, miss and eviction counters, see ``stats()``.
+    """
+
+    def __init__(self, max_size=1024, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > self.clock():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self.clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                size=len(self._data),
+                max_size=self.max_size,
+                ttl=self.ttl,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+            )
+
+
+token_cache = LRUCache(
+    max_size=getattr(settings, "TOKEN_AUTH_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "TOKEN_AUTH_CACHE_TTL", 30),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that keeps resolved tokens in ``token_cache``.
+
+    A cache hit authenticates without touching the database. Each request
+    gets its own copy of the cached user and token, so changes made while
+    handling one request never leak into another. Revoking a token or
+    changing its user drops the cached entry in this process, other worker
+    processes pick the change up once the entry's TTL runs out, which is
+    why the default TTL is short.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, (user.pk, detach(token, detach(user))))
+            return (user, token)
+
+        _, token = cached
+        user = detach(token.user)
+        if not user.is_active:
+            token_cache.invalidate(key)
+            raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+        return (user, detach(token, user))
+
+
+def detach(instance, user=None):
+    """
+    Copy a model instance, without sharing its cache of related objects.
+    """
+    instance = copy.copy(instance)
+    instance._state.fields_cache = {}
+    if user is not None:
+        instance.user = user
+    return instance
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(instance, **kwargs):
+    token_cache.invalidate_where(lambda entry: entry[0] == instance.pk)
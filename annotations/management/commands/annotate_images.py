@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from annotations.annotators import annotate_queued_images, get_annotator
+
+
+class Command(BaseCommand):
+    help = "Annotate the queued images with the configured annotator."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Number of images annotated per batch, by default the "
+            "annotator's own batch size.",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Stop after this many images.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and pick up new images as they are queued.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait for new images when the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        annotator = type(get_annotator()).__name__
+        while True:
+            began = time.perf_counter()
+            processed = annotate_queued_images(
+                batch_size=options["batch_size"], limit=options["limit"]
+            )
+            elapsed = time.perf_counter() - began
+            if processed:
+                self.stdout.write(
+                    f"{annotator} annotated {processed} images in {elapsed:.3f}s "
+                    f"({processed / elapsed:.1f} images/s)."
+                )
+            if not options["loop"]:
+                if not processed:
+                    self.stdout.write("No images are queued.")
+                return
+            if not processed:
+                time.sleep(options["interval"])
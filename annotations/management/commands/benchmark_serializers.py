@@ -0,0 +1,89 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from annotations.models import Annotation, Comment, Image
+from annotations.renderers import ORJSONRenderer
+from annotations.serializers import (
+    CommentSerializer,
+    CommentValuesSerializer,
+    ImageSerializer,
+    ImageValuesSerializer,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-row cost of the ModelSerializer and values() list paths "
+        "and of the stock and orjson renderers. Sample rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        try:
+            with transaction.atomic():
+                self.populate(rows)
+                self.run(rows, repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, rows):
+        user = User.objects.create(username="benchmark-serializers")
+        annotations = [
+            Annotation.objects.get_or_create(annotation=value)[0]
+            for value, _ in Annotation.EXISTING_ANNOTATIONS
+        ]
+        # bulk_create skips post_save, so no annotation work is triggered
+        images = Image.objects.bulk_create(
+            Image(image=f"media/images/bench_{i}.jpg", user=user) for i in range(rows)
+        )
+        Image.annotation.through.objects.bulk_create(
+            Image.annotation.through(image_id=image.pk, annotation_id=annotation.pk)
+            for image in images
+            for annotation in annotations[:2]
+        )
+        Comment.objects.bulk_create(
+            Comment(image=image, user=user, text="benchmark comment")
+            for image in images
+        )
+
+    def run(self, rows, repeat):
+        images = Image.objects.all()
+        comments = Comment.objects.all()
+        cases = [
+            ("ImageSerializer", lambda: ImageSerializer(images, many=True).data),
+            ("ImageValuesSerializer", lambda: ImageValuesSerializer(images).data),
+            ("CommentSerializer", lambda: CommentSerializer(comments, many=True).data),
+            ("CommentValuesSerializer", lambda: CommentValuesSerializer(comments).data),
+        ]
+        for name, serialize in cases:
+            self.report(name, rows, repeat, serialize)
+
+        data = ImageValuesSerializer(images).data
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            self.report(
+                type(renderer).__name__, rows, repeat, lambda: renderer.render(data)
+            )
+
+    def report(self, name, rows, repeat, func):
+        best = min(self.timed(func) for _ in range(repeat))
+        self.stdout.write(
+            f"{name:<26} {best * 1e6 / rows:8.2f} us/row  ({best * 1e3:.1f} ms total)"
+        )
+
+    def timed(self, func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
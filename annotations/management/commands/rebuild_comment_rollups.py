@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from annotations.rollups import rebuild_comment_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute comment sentiment and rebuild the comment rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of comments or rollups written per query.",
+        )
+
+    def handle(self, *args, **options):
+        comments, rollups = rebuild_comment_rollups(batch_size=options["batch_size"])
+        self.stdout.write(f"Rolled up {comments} comments into {rollups} buckets.")
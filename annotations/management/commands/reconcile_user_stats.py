@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from annotations.stats import reconcile_user_stats
+
+
+class Command(BaseCommand):
+    help = "Recount the per-user activity counters and repair any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of users recounted per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        repaired = reconcile_user_stats(batch_size=options["batch_size"])
+        self.stdout.write(f"Repaired the counters of {repaired} users.")
@@ -0,0 +1,187 @@
+import io
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve
+from PIL import Image as PILImage
+
+from annotations.middleware import read_traffic_log
+
+# Status of requests that couldn't be rebuilt and weren't sent
+SKIPPED = "skipped"
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not values:
+        return 0
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def synthetic_file(size):
+    """
+    A valid JPEG padded to ``size`` bytes; decoders ignore the padding.
+    """
+    content = io.BytesIO()
+    PILImage.new("RGB", (8, 8)).save(content, "JPEG")
+    data = content.getvalue()
+    return data + b"\0" * max(0, size - len(data))
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a log written by TrafficCaptureMiddleware against a running "
+        "server and report throughput and latency percentiles per route."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("log", help="Path of the captured traffic log.")
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument(
+            "--concurrency", type=int, default=8, help="Number of client threads."
+        )
+        parser.add_argument(
+            "--speedup",
+            type=float,
+            default=1.0,
+            help="Replay this many times faster than captured, 0 for no delays.",
+        )
+        parser.add_argument(
+            "--token", help="API token the requests are authenticated with."
+        )
+        parser.add_argument(
+            "--field",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="Value sent for a captured form or JSON field, e.g. user=1.",
+        )
+        parser.add_argument("--limit", type=int, help="Replay the first N requests.")
+        parser.add_argument("--timeout", type=float, default=30)
+
+    def handle(self, *args, **options):
+        records = sorted(read_traffic_log(options["log"]), key=lambda r: r["ts"])
+        records = records[: options["limit"]]
+        if not records:
+            raise CommandError("The traffic log is empty.")
+
+        self.base_url = options["base_url"].rstrip("/")
+        self.token = options["token"]
+        self.timeout = options["timeout"]
+        self.fields = dict(field.split("=", 1) for field in options["field"])
+        self.local = threading.local()
+
+        first, speedup = records[0]["ts"], options["speedup"]
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            results = list(
+                pool.map(
+                    lambda record: self.replay(
+                        record,
+                        began + (record["ts"] - first) / speedup if speedup else 0,
+                    ),
+                    records,
+                )
+            )
+        self.report(results, time.perf_counter() - began)
+
+    @property
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+            if self.token:
+                self.local.session.headers["Authorization"] = f"Token {self.token}"
+        return self.local.session
+
+    def route(self, record):
+        # Group by the current urls.py patterns where the path still resolves
+        try:
+            return resolve(record["path"]).route
+        except Resolver404:
+            return record.get("route") or record["path"]
+
+    def form_data(self, record):
+        fields = record.get("fields") or {}
+        return {name: self.fields.get(name, values) for name, values in fields.items()}
+
+    def request_kwargs(self, record):
+        """
+        Rebuild the request from its redacted record, or return None if its
+        body wasn't captured.
+        """
+        kwargs = dict(params=record["query"], timeout=self.timeout)
+        content_type = record.get("content_type") or ""
+        if record.get("files") or content_type.startswith("multipart/"):
+            kwargs["files"] = {
+                name: (f"{name}.jpg", synthetic_file(size), "image/jpeg")
+                for name, size in record.get("files", {}).items()
+            }
+            kwargs["data"] = self.form_data(record)
+        elif content_type == "application/x-www-form-urlencoded":
+            kwargs["data"] = self.form_data(record)
+        elif record.get("body") is not None:
+            body = record["body"]
+            if isinstance(body, dict):
+                body = {**body, **self.fields}
+            kwargs["json"] = body
+        elif record.get("request_bytes"):
+            return None
+        return kwargs
+
+    def replay(self, record, at):
+        delay = at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        kwargs = self.request_kwargs(record)
+        if kwargs is None:
+            return self.route(record), SKIPPED, 0
+
+        url = self.base_url + record["path"]
+        started = time.perf_counter()
+        try:
+            response = self.session.request(record["method"], url, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        return self.route(record), status, time.perf_counter() - started
+
+    def report(self, results, elapsed):
+        routes, skipped = defaultdict(list), defaultdict(int)
+        for route, status, latency in results:
+            if status == SKIPPED:
+                skipped[route] += 1
+            else:
+                routes[route].append((status, latency))
+        rows = sorted(routes.items())
+        rows.append(("TOTAL", [call for calls in routes.values() for call in calls]))
+
+        self.stdout.write(
+            f"{'route':<48} {'requests':>8} {'errors':>6} {'req/s':>8} "
+            f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        )
+        for route, calls in rows:
+            latencies = sorted(latency * 1000 for _, latency in calls) or [0]
+            errors = sum(1 for status, _ in calls if status is None or status >= 400)
+            self.stdout.write(
+                f"{route:<48} {len(calls):>8} {errors:>6} "
+                f"{len(calls) / elapsed:>8.1f} "
+                f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 90):>8.1f} "
+                f"{percentile(latencies, 99):>8.1f} {latencies[-1]:>8.1f}"
+            )
+
+        if skipped:
+            self.stdout.write(
+                "\nNot replayed, the request bodies weren't captured:\n"
+                + "\n".join(
+                    f"{route:<48} {count:>8}"
+                    for route, count in sorted(skipped.items())
+                )
+            )
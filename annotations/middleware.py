@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+class TrafficLog:
+    """
+    Append-only JSON lines file of captured requests.
+
+    Each record is written with a single ``write`` on an ``O_APPEND``
+    descriptor, so worker processes can share one log without interleaving
+    lines.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(
+                    self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+                )
+            os.write(self._fd, line)
+
+
+def redact(value):
+    """
+    Mask ``value`` but keep its shape, so a similar request can be rebuilt.
+
+    Strings keep their length, with digits for numeric strings such as ids
+    and page numbers. Numbers become 1, containers are redacted item by item.
+    """
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return ("1" if value.isdigit() else "x") * len(value)
+    if isinstance(value, bool) or value is None:
+        return value
+    return type(value)(1)
+
+
+def read_traffic_log(path):
+    with open(path) as log:
+        return [json.loads(line) for line in log if line.strip()]
+
+
+class TrafficCaptureMiddleware:
+    """
+    Record every request to ``TRAFFIC_CAPTURE["PATH"]`` for later replay.
+
+    The method, path, route, payload sizes, status and timing are kept.
+    Query parameters, form fields and JSON bodies of up to
+    ``TRAFFIC_CAPTURE["MAX_BODY"]`` bytes are only kept redacted, see
+    ``redact``. Uploaded files and credentials are never written.
+    Disabled unless ``TRAFFIC_CAPTURE["ENABLED"]`` is set.
+    """
+
+    def __init__(self, get_response):
+        config = getattr(settings, "TRAFFIC_CAPTURE", {})
+        if not config.get("ENABLED"):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.log = TrafficLog(config["PATH"])
+        self.max_body = config.get("MAX_BODY", 65536)
+
+    def __call__(self, request):
+        body = self.json_body(request)
+        started = time.time()
+        began = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - began
+
+        match = request.resolver_match
+        # Form data is only inspected if the view parsed it already
+        fields = request.__dict__.get("_post", {})
+        files = request.__dict__.get("_files", {})
+        if response.streaming:
+            response_bytes = int(response.get("Content-Length", 0) or 0)
+        else:
+            response_bytes = len(response.content)
+        self.log.append(
+            dict(
+                ts=started,
+                method=request.method,
+                path=request.path,
+                route=match.route if match else None,
+                kwargs=match.kwargs if match else {},
+                query=[[key, redact(values)] for key, values in request.GET.lists()],
+                content_type=request.content_type,
+                request_bytes=int(request.META.get("CONTENT_LENGTH") or 0),
+                fields=redact(dict(fields.lists()) if fields else {}),
+                files={name: upload.size for name, upload in files.items()},
+                body=body,
+                status=response.status_code,
+                response_bytes=response_bytes,
+                duration_ms=round(duration * 1000, 3),
+            )
+        )
+        return response
+
+    def json_body(self, request):
+        # Read before the view, which can't be done after it consumed the
+        # stream. Large bodies are left alone to keep memory bounded.
+        size = int(request.META.get("CONTENT_LENGTH") or 0)
+        if request.content_type != "application/json" or not 0 < size <= self.max_body:
+            return None
+        try:
+            return redact(json.loads(request.body))
+        except ValueError:
+            return None
@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.contrib.auth.models import User
-import random
-import time
-from django.db.models.signals import m2m_changed, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
+from textblob import TextBlob
+
+from .tiles import get_tile_cache
 
 
 class Annotation(models.Model):
@@ -30,48 +32,416 @@ class Image(models.Model):
     image = models.ImageField(upload_to="media/images/")
     annotation = models.ManyToManyField(Annotation, related_name="images", blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="queued", db_index=True
+    )
+    size = models.PositiveBigIntegerField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored file name, so save() notices a replaced file
+        if "image" in field_names:
+            instance._stored_image = values[field_names.index("image")]
+        return instance
+
+    def save(self, *args, **kwargs):
+        replaced = (
+            hasattr(self, "_stored_image") and self.image.name != self._stored_image
+        )
+        if self._state.adding or replaced:
+            try:
+                self.size = self.image.size
+            except (OSError, ValueError):
+                # The file isn't stored (yet), e.g. when created from a URL
+                self.size = 0
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and "image" in update_fields:
+                kwargs["update_fields"] = {*update_fields, "size"}
+        # Read by post_save handlers such as remove_replaced_tiles
+        self._image_replaced = replaced
+        super().save(*args, **kwargs)
+        self._stored_image = self.image.name
 
     def process_annotations(self):
-        if self.annotation.count() == 1:
-            self.status = "processing"
-            self.save()
-        elif self.annotation.count() == len(Annotation.EXISTING_ANNOTATIONS):
-            self.status = "success"
-            self.save()
-
-    def add_random_annotation(self):
-        # random wait time(sleep)
-        sleep_time = random.randint(5, 50)
-        time.sleep(sleep_time)
-
-        # pick a random annotation
-        random_annotation = random.choice(Annotation.EXISTING_ANNOTATIONS)
-
-        # Add the annotation to the image
-        annotation_obj, _ = Annotation.objects.get_or_create(
-            annotation=random_annotation[0]
+        update_annotation_status([self.pk])
+        self.refresh_from_db(fields=["status"])
+
+    def add_annotations(self):
+        annotate_images([self])
+
+
+def annotate_images(images):
+    """
+    Annotate every image in ``images`` with the configured annotator.
+
+    ``annotate_queued_images`` drives this for the queued images in batches.
+
+    The results are applied with ``apply_annotations`` in a fixed number of
+    queries. Images the annotator could not handle are marked as failed.
+    """
+    from .annotators import get_annotator
+
+    if not images:
+        return
+
+    results = get_annotator().annotate(images)
+    apply_annotations(results)
+
+    failed = [image_id for image_id, labels in results.items() if not labels]
+    if failed:
+        transition_status(
+            Image.objects.filter(pk__in=failed, status="queued"), models.Value("fail")
+        )
+
+    # Keep the in-memory instances in step so a later save() doesn't revert them
+    statuses = dict(
+        Image.objects.filter(pk__in=[image.pk for image in images]).values_list(
+            "pk", "status"
+        )
+    )
+    for image in images:
+        image.status = statuses[image.pk]
+
+
+def apply_annotations(results):
+    """
+    Apply a batch of annotation results and update the affected statuses.
+
+    ``results`` maps image ids to the annotation values found for them.
+    Missing ``Annotation`` rows are created, the image links are added with a
+    single insert and statuses are moved forward with a single ``UPDATE``.
+    The insert bypasses ``m2m_changed`` and the update bypasses ``post_save``,
+    so no further annotation work is triggered.
+    """
+    values = {value for labels in results.values() for value in labels}
+    if not values:
+        return
+
+    annotation_ids = get_annotation_ids(values)
+    through = Image.annotation.through
+    through.objects.bulk_create(
+        [
+            through(image_id=image_id, annotation_id=annotation_ids[value])
+            for image_id, labels in results.items()
+            for value in set(labels)
+        ],
+        ignore_conflicts=True,
+    )
+    update_annotation_status(list(results))
+
+
+def get_annotation_ids(values):
+    """
+    Map annotation values to ``Annotation`` ids, creating missing rows.
+    """
+    annotation_ids = dict(
+        Annotation.objects.filter(annotation__in=values).values_list("annotation", "pk")
+    )
+    missing = [value for value in set(values) if value not in annotation_ids]
+    if missing:
+        created = Annotation.objects.bulk_create(
+            Annotation(annotation=value) for value in missing
         )
-        self.annotation.add(annotation_obj)
+        annotation_ids.update((obj.annotation, obj.pk) for obj in created)
+    return annotation_ids
+
+
+def moderate_annotations(image_ids, add=(), remove=()):
+    """
+    Add and remove annotation values on many images at once.
+
+    Links are deleted and inserted with set-based statements on the M2M
+    through table, bypassing ``m2m_changed``, and the status of every
+    affected image is recomputed by ``recompute_annotation_status``.
+    Unknown image ids are ignored. Returns the ids of the images changed.
+    """
+    image_ids = list(
+        Image.objects.filter(pk__in=image_ids).values_list("pk", flat=True)
+    )
+    if not image_ids or not (add or remove):
+        return image_ids
+
+    through = Image.annotation.through
+    with transaction.atomic():
+        annotation_ids = get_annotation_ids(set(add) | set(remove))
+        if remove:
+            through.objects.filter(
+                image_id__in=image_ids,
+                annotation_id__in=[annotation_ids[value] for value in remove],
+            ).delete()
+        if add:
+            insert_annotation_links(
+                image_ids, [annotation_ids[value] for value in set(add)]
+            )
+        recompute_annotation_status(image_ids)
+    return image_ids
+
+
+def insert_annotation_links(image_ids, annotation_ids):
+    """
+    Link every image to every annotation with one ``INSERT ... SELECT``.
+
+    Unlike ``bulk_create`` this isn't split into batches by the number of
+    rows, and links that already exist are skipped.
+    """
+    through = Image.annotation.through
+    quote = connection.ops.quote_name
+    table = quote(through._meta.db_table)
+    image_column = quote(through._meta.get_field("image").column)
+    annotation_column = quote(through._meta.get_field("annotation").column)
+    image_table = quote(Image._meta.db_table)
+    annotation_table = quote(Annotation._meta.db_table)
+
+    sql = (
+        f"INSERT INTO {table} ({image_column}, {annotation_column}) "
+        f"SELECT i.id, a.id FROM {image_table} i, {annotation_table} a "
+        f"WHERE i.id IN ({', '.join(['%s'] * len(image_ids))}) "
+        f"AND a.id IN ({', '.join(['%s'] * len(annotation_ids))}) "
+        f"AND NOT EXISTS (SELECT 1 FROM {table} t WHERE "
+        f"t.{image_column} = i.id AND t.{annotation_column} = a.id)"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*image_ids, *annotation_ids])
+
+
+def recompute_annotation_status(image_ids):
+    """
+    Derive the status of images from their annotations in one ``UPDATE``.
+
+    Unlike ``update_annotation_status`` this may move images back, e.g.
+    from "success" to "processing" once an annotation was removed. Failed
+    images without annotations are left alone.
+    """
+    through = Image.annotation.through
+    annotated = through.objects.filter(image_id__in=image_ids).values("image_id")
+    complete = (
+        annotated.annotate(total=models.Count("annotation_id"))
+        .filter(total=len(Annotation.EXISTING_ANNOTATIONS))
+        .values("image_id")
+    )
+    transition_status(
+        Image.objects.filter(
+            ~models.Q(status="fail") | models.Q(pk__in=annotated),
+            pk__in=image_ids,
+        ),
+        models.Case(
+            models.When(pk__in=complete, then=models.Value("success")),
+            models.When(pk__in=annotated, then=models.Value("processing")),
+            default=models.Value("queued"),
+        ),
+    )
+
+
+def update_annotation_status(image_ids):
+    """
+    Move annotated images forward from "queued" or "processing".
+
+    Images holding every existing annotation become "success", other
+    annotated images that are still "queued" become "processing". This is a
+    single ``UPDATE ... WHERE status IN (...)`` statement.
+    """
+    through = Image.annotation.through
+    annotated = through.objects.filter(image_id__in=image_ids).values("image_id")
+    complete = (
+        annotated.annotate(total=models.Count("annotation_id"))
+        .filter(total=len(Annotation.EXISTING_ANNOTATIONS))
+        .values("image_id")
+    )
+    transition_status(
+        Image.objects.filter(
+            models.Q(status="queued") | models.Q(pk__in=complete),
+            pk__in=annotated,
+            status__in=["queued", "processing"],
+        ),
+        models.Case(
+            models.When(pk__in=complete, then=models.Value("success")),
+            default=models.Value("processing"),
+        ),
+    )
+
+
+def transition_status(queryset, status):
+    """
+    Set the status of the images in ``queryset`` to the ``status`` expression.
+
+    The transitions are counted per user and old/new status first, so the
+    ``UserStats`` counters follow in a single extra ``UPDATE``.
+    """
+    output = models.CharField()
+    with transaction.atomic(savepoint=False):
+        transitions = (
+            queryset.annotate(new_status=models.ExpressionWrapper(status, output))
+            .values("user_id", "status", "new_status")
+            .annotate(total=models.Count("pk"))
+            .order_by()
+        )
+        deltas = {}
+        for row in transitions:
+            if row["status"] == row["new_status"]:
+                continue
+            user = deltas.setdefault(row["user_id"], {})
+            user[row["status"]] = user.get(row["status"], 0) - row["total"]
+            user[row["new_status"]] = user.get(row["new_status"], 0) + row["total"]
+        queryset.update(status=status)
+        UserStats.add(deltas)
 
 
 @receiver(post_save, sender=Image)
-def annotate_image(instance, **kwargs):
+def annotate_image(instance, created, raw=False, **kwargs):
+    from .annotators import get_annotator
 
-    instance.add_random_annotation()
+    # Only new images get annotated; status changes must not schedule more work.
+    # Batch backends leave them queued for manage.py annotate_images instead.
+    if created and not raw and get_annotator().inline:
+        instance.add_annotations()
 
 
 @receiver(m2m_changed, sender=Image.annotation.through)
-def process_annotations(sender, instance, action, **kwargs):
-    if action == "post_add":
-        instance.process_annotations()
+def process_annotations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_add" and pk_set:
+        if reverse:
+            update_annotation_status(list(pk_set))
+        else:
+            update_annotation_status([instance.pk])
+
+
+@receiver(post_delete, sender=Image)
+def remove_tiles(instance, **kwargs):
+    get_tile_cache().remove(instance)
+
+
+@receiver(post_save, sender=Image)
+def remove_replaced_tiles(instance, raw=False, **kwargs):
+    # The tiles of the previous file would otherwise keep being served
+    if getattr(instance, "_image_replaced", False) and not raw:
+        get_tile_cache().remove(instance)
 
 
 class Comment(models.Model):
     image = models.ForeignKey(Image, related_name="comments", on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    sentiment = models.FloatField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        self.sentiment = TextBlob(self.text).sentiment.polarity
+        super().save(*args, **kwargs)
 
     @property
     def comment_length(self):
         return len(self.text.split())
+
+
+class CommentRollup(models.Model):
+    """
+    Comment activity of one image, or of all images, in one time bucket.
+
+    Kept up to date by ``annotations.rollups`` as comments come and go, so
+    trends can be read without scanning comments. Rows without an image
+    hold the totals over all images.
+    """
+
+    GRANULARITY_CHOICES = [
+        ("hour", "Hour"),
+        ("day", "Day"),
+    ]
+
+    image = models.ForeignKey(
+        Image, related_name="rollups", on_delete=models.CASCADE, null=True
+    )
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    comment_count = models.IntegerField(default=0)
+    user_count = models.IntegerField(default=0)
+    sentiment_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["image", "granularity", "bucket"],
+                name="unique_image_comment_rollup",
+            ),
+            models.UniqueConstraint(
+                fields=["granularity", "bucket"],
+                condition=models.Q(image=None),
+                name="unique_global_comment_rollup",
+            ),
+        ]
+
+
+class CommentRollupUser(models.Model):
+    """
+    Users who commented within a ``CommentRollup`` bucket.
+    """
+
+    rollup = models.ForeignKey(
+        CommentRollup, related_name="users", on_delete=models.CASCADE
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["rollup", "user"], name="unique_comment_rollup_user"
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    Precomputed activity counters of a user.
+
+    Kept up to date by ``annotations.stats`` and ``transition_status``; the
+    ``reconcile_user_stats`` command repairs any drift.
+    """
+
+    STATUS_FIELDS = [status for status, _ in Image.STATUS_CHOICES]
+
+    user = models.OneToOneField(
+        User, primary_key=True, related_name="stats", on_delete=models.CASCADE
+    )
+    queued = models.IntegerField(default=0)
+    processing = models.IntegerField(default=0)
+    success = models.IntegerField(default=0)
+    fail = models.IntegerField(default=0)
+    comments_made = models.IntegerField(default=0)
+    comments_received = models.IntegerField(default=0)
+    storage_bytes = models.BigIntegerField(default=0)
+
+    @classmethod
+    def add(cls, deltas, create=True):
+        """
+        Add ``deltas``, a dict of ``{user_id: {field: delta}}``, in one UPDATE.
+
+        Missing rows are created first unless ``create`` is false, which is
+        what removals use so they never recreate rows of deleted users.
+        """
+        deltas = {
+            user_id: {field: delta for field, delta in fields.items() if delta}
+            for user_id, fields in deltas.items()
+        }
+        deltas = {user_id: fields for user_id, fields in deltas.items() if fields}
+        if not deltas:
+            return
+
+        if create:
+            cls.objects.bulk_create(
+                [cls(user_id=user_id) for user_id in deltas], ignore_conflicts=True
+            )
+        fields = {field for changes in deltas.values() for field in changes}
+        cls.objects.filter(pk__in=deltas).update(
+            **{
+                field: models.F(field)
+                + models.Case(
+                    *[
+                        models.When(pk=user_id, then=models.Value(changes[field]))
+                        for user_id, changes in deltas.items()
+                        if field in changes
+                    ],
+                    default=models.Value(0),
+                )
+                for field in fields
+            }
+        )
@@ -0,0 +1,373 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Trunc
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from textblob import TextBlob
+
+from .models import Comment, CommentRollup, CommentRollupUser, Image
+
+SPANS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+
+def truncate(moment, granularity):
+    """
+    Return the start of the ``granularity`` bucket holding ``moment``, in UTC.
+    """
+    moment = moment.astimezone(dt_timezone.utc)
+    if granularity == "day":
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def trunc(granularity):
+    return Trunc("created_at", granularity, tzinfo=dt_timezone.utc)
+
+
+def bucket_keys(image_id, moment):
+    return [
+        (key_image_id, granularity, truncate(moment, granularity))
+        for key_image_id in (image_id, None)
+        for granularity in SPANS
+    ]
+
+
+def rollup_keys(comment):
+    return bucket_keys(comment.image_id, comment.created_at)
+
+
+def rollups_of(comment):
+    """
+    The per-image and global rollups a comment counts towards.
+    """
+    query = Q()
+    for image_id, granularity, bucket in rollup_keys(comment):
+        query |= Q(image_id=image_id, granularity=granularity, bucket=bucket)
+    return CommentRollup.objects.filter(query)
+
+
+def refresh_user_counts(rollup_ids):
+    users = (
+        CommentRollupUser.objects.filter(rollup=OuterRef("pk"))
+        .values("rollup")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    CommentRollup.objects.filter(pk__in=rollup_ids).update(
+        user_count=Coalesce(Subquery(users), 0)
+    )
+
+
+def add_comment(comment):
+    """
+    Count a new comment in its rollups, creating missing buckets.
+    """
+    with transaction.atomic():
+        CommentRollup.objects.bulk_create(
+            [
+                CommentRollup(image_id=image_id, granularity=granularity, bucket=bucket)
+                for image_id, granularity, bucket in rollup_keys(comment)
+            ],
+            ignore_conflicts=True,
+        )
+        rollups = rollups_of(comment)
+        rollups.update(
+            comment_count=F("comment_count") + 1,
+            sentiment_sum=F("sentiment_sum") + comment.sentiment,
+        )
+        rollup_ids = list(rollups.values_list("pk", flat=True))
+        CommentRollupUser.objects.bulk_create(
+            [
+                CommentRollupUser(rollup_id=rollup_id, user_id=comment.user_id)
+                for rollup_id in rollup_ids
+            ],
+            ignore_conflicts=True,
+        )
+        refresh_user_counts(rollup_ids)
+
+
+def remove_comment(comment):
+    """
+    Take a deleted comment out of its rollups.
+
+    The user stays counted in a bucket as long as they have other comments
+    in it.
+    """
+    with transaction.atomic():
+        rollups = rollups_of(comment)
+        rollups.update(
+            comment_count=F("comment_count") - 1,
+            sentiment_sum=F("sentiment_sum") - comment.sentiment,
+        )
+        rollup_ids = []
+        for rollup in rollups:
+            others = Comment.objects.filter(
+                user_id=comment.user_id,
+                created_at__gte=rollup.bucket,
+                created_at__lt=rollup.bucket + SPANS[rollup.granularity],
+            ).exclude(pk=comment.pk)
+            if rollup.image_id is not None:
+                others = others.filter(image_id=rollup.image_id)
+            if not others.exists():
+                rollup.users.filter(user_id=comment.user_id).delete()
+            rollup_ids.append(rollup.pk)
+        refresh_user_counts(rollup_ids)
+
+
+def remove_comments(comments):
+    """
+    Take every comment in ``comments``, which are about to be deleted, out of
+    their rollups at once.
+
+    The comments are grouped per image, user and hour, so the number of
+    queries doesn't depend on how many comments there are. Returns the ids
+    of the comments removed.
+    """
+    comment_ids = set(comments.values_list("pk", flat=True))
+    groups = (
+        comments.annotate(hour=trunc("hour"))
+        .values("image_id", "user_id", "hour")
+        .annotate(total=Count("pk"), sentiment=Sum("sentiment"))
+        .order_by()
+    )
+    removed, users = {}, set()
+    for row in groups:
+        for key in bucket_keys(row["image_id"], row["hour"]):
+            count, sentiment = removed.get(key, (0, 0))
+            removed[key] = (count + row["total"], sentiment + row["sentiment"])
+            users.add((key, row["user_id"]))
+    if not removed:
+        return comment_ids
+
+    with transaction.atomic():
+        query = Q()
+        for granularity in SPANS:
+            buckets = {bucket for _, g, bucket in removed if g == granularity}
+            query |= Q(granularity=granularity, bucket__in=buckets)
+        image_ids = {image_id for image_id, _, _ in removed if image_id is not None}
+        rollups = {
+            (image_id, granularity, bucket): pk
+            for pk, image_id, granularity, bucket in CommentRollup.objects.filter(
+                query, Q(image_id__in=image_ids) | Q(image=None)
+            ).values_list("pk", "image_id", "granularity", "bucket")
+        }
+        # Comments the rollups never counted have no bucket to take them out of
+        changes = {
+            rollups[key]: change for key, change in removed.items() if key in rollups
+        }
+        CommentRollup.objects.filter(pk__in=changes).update(
+            comment_count=F("comment_count")
+            - Case(
+                *[When(pk=pk, then=Value(count)) for pk, (count, _) in changes.items()],
+                default=Value(0),
+            ),
+            sentiment_sum=F("sentiment_sum")
+            - Case(
+                *[
+                    When(pk=pk, then=Value(sentiment))
+                    for pk, (_, sentiment) in changes.items()
+                ],
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        )
+
+        # Users stay counted in a bucket as long as they have other comments
+        # in it
+        days = [bucket for _, granularity, bucket in removed if granularity == "day"]
+        others = (
+            Comment.objects.filter(
+                user_id__in={user_id for _, user_id in users},
+                created_at__gte=min(days),
+                created_at__lt=max(days) + SPANS["day"],
+            )
+            .exclude(pk__in=comments.values("pk"))
+            .annotate(hour=trunc("hour"))
+            .values_list("image_id", "user_id", "hour")
+            .distinct()
+        )
+        staying = {
+            (key, user_id)
+            for image_id, user_id, hour in others
+            for key in bucket_keys(image_id, hour)
+        }
+        leaving = {}
+        for key, user_id in users - staying:
+            if key in rollups:
+                leaving.setdefault(user_id, []).append(rollups[key])
+        if leaving:
+            query = Q()
+            for user_id, rollup_ids in leaving.items():
+                query |= Q(user_id=user_id, rollup_id__in=rollup_ids)
+            CommentRollupUser.objects.filter(query).delete()
+        refresh_user_counts(list(changes))
+    return comment_ids
+
+
+def cascaded_comments(origin):
+    """
+    The comments deleted along with ``origin``, the instance or queryset
+    whose deletion was requested, or None when it isn't known here.
+    """
+    if isinstance(origin, QuerySet):
+        model, pks = origin.model, origin.values("pk")
+    else:
+        model, pks = type(origin), [origin.pk]
+    if model is Comment:
+        return Comment.objects.filter(pk__in=pks)
+    if model is Image:
+        return Comment.objects.filter(image__in=pks)
+    if model is User:
+        return Comment.objects.filter(Q(user__in=pks) | Q(image__user__in=pks))
+    return None
+
+
+def rebuild_comment_rollups(batch_size=1000):
+    """
+    Recompute the sentiment of every comment and rebuild all rollups.
+
+    Picks up comments the signals never saw, e.g. those created with
+    ``bulk_create`` or before rollups existed. The buckets are built with a
+    few grouped queries. Returns the number of comments and of rollups.
+    """
+    comments = Comment.objects.order_by("pk").only("pk", "text", "sentiment")
+    last = total = 0
+    while True:
+        batch = list(comments.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            break
+        last = batch[-1].pk
+        total += len(batch)
+        changed = []
+        for comment in batch:
+            sentiment = TextBlob(comment.text).sentiment.polarity
+            if comment.sentiment != sentiment:
+                comment.sentiment = sentiment
+                changed.append(comment)
+        Comment.objects.bulk_update(changed, ["sentiment"])
+
+    with transaction.atomic():
+        CommentRollup.objects.all().delete()
+        for granularity in SPANS:
+            for fields in (["image_id"], []):
+                buckets = Comment.objects.annotate(bucket=trunc(granularity)).values(
+                    *fields, "bucket"
+                )
+                CommentRollup.objects.bulk_create(
+                    (
+                        CommentRollup(
+                            image_id=row.get("image_id"),
+                            granularity=granularity,
+                            bucket=row["bucket"],
+                            comment_count=row["comment_count"],
+                            user_count=row["user_count"],
+                            sentiment_sum=row["sentiment_sum"],
+                        )
+                        for row in buckets.annotate(
+                            comment_count=Count("pk"),
+                            user_count=Count("user_id", distinct=True),
+                            sentiment_sum=Sum("sentiment"),
+                        ).order_by()
+                    ),
+                    batch_size=batch_size,
+                )
+
+                rollups = CommentRollup.objects.filter(
+                    granularity=granularity, image__isnull=not fields
+                )
+                rollup_ids = {
+                    (image_id, bucket): pk
+                    for pk, image_id, bucket in rollups.values_list(
+                        "pk", "image_id", "bucket"
+                    )
+                }
+                CommentRollupUser.objects.bulk_create(
+                    (
+                        CommentRollupUser(
+                            rollup_id=rollup_ids[row.get("image_id"), row["bucket"]],
+                            user_id=row["user_id"],
+                        )
+                        for row in buckets.values(*fields, "bucket", "user_id")
+                        .distinct()
+                        .order_by()
+                    ),
+                    batch_size=batch_size,
+                )
+    return total, CommentRollup.objects.count()
+
+
+def comment_trend(image_id, granularity, since):
+    """
+    Buckets of ``granularity`` from ``since`` on, for one image or, when
+    ``image_id`` is None, for all images.
+    """
+    return (
+        CommentRollup.objects.filter(
+            image_id=image_id, granularity=granularity, bucket__gte=since
+        )
+        .exclude(comment_count=0)
+        .order_by("bucket")
+        .values("bucket", "comment_count", "user_count", "sentiment_sum")
+    )
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment(instance, raw=False, **kwargs):
+    # Edits may move a comment to another bucket or change its sentiment
+    instance._rollup_previous = None
+    if instance.pk is not None and not raw:
+        instance._rollup_previous = Comment.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Comment)
+def update_rollups_on_save(instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_rollup_previous", None)
+    if previous is not None:
+        fields = ("image_id", "user_id", "created_at", "sentiment")
+        if all(getattr(previous, f) == getattr(instance, f) for f in fields):
+            return
+        remove_comment(previous)
+    add_comment(instance)
+
+
+@receiver(pre_delete, sender=Comment)
+def remove_cascaded_comments(instance, origin=None, **kwargs):
+    # Comments deleted along with an image, a user or in bulk are taken out
+    # all at once, when the first of them is about to be deleted
+    if origin is None or origin is instance:
+        return
+    removed = origin.__dict__.get("_rollups_removed")
+    if not removed:
+        comments = cascaded_comments(origin)
+        if comments is None:
+            return
+        removed = origin._rollups_removed = remove_comments(comments)
+    if instance.pk in removed:
+        removed.discard(instance.pk)
+        instance._rollups_removed = True
+
+
+@receiver(post_delete, sender=Comment)
+def update_rollups_on_delete(instance, **kwargs):
+    if not getattr(instance, "_rollups_removed", False):
+        remove_comment(instance)
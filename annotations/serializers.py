@@ -1,5 +1,7 @@
+from django.core.files.storage import default_storage
+from django.db.models import QuerySet
 from rest_framework import serializers
-from .models import Image, Comment
+from .models import Annotation, Image, Comment, CommentRollup
 
 
 class ImageSerializer(serializers.ModelSerializer):
@@ -28,3 +30,145 @@ class CommentCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ["text"]
+
+
+class BulkAnnotationSerializer(serializers.Serializer):
+    images = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=10000
+    )
+    add = serializers.ListField(
+        child=serializers.ChoiceField(choices=Annotation.EXISTING_ANNOTATIONS),
+        required=False,
+        default=list,
+    )
+    remove = serializers.ListField(
+        child=serializers.ChoiceField(choices=Annotation.EXISTING_ANNOTATIONS),
+        required=False,
+        default=list,
+    )
+
+    def validate(self, attrs):
+        if not attrs["add"] and not attrs["remove"]:
+            raise serializers.ValidationError("Nothing to add or remove.")
+        if set(attrs["add"]) & set(attrs["remove"]):
+            raise serializers.ValidationError(
+                "An annotation can't be both added and removed."
+            )
+        return attrs
+
+
+class ValuesSerializer:
+    """
+    Read-only serializer that builds plain dicts from ``values()`` rows.
+
+    Skips DRF's per-field machinery for list and export responses. The output
+    matches the equivalent ``ModelSerializer`` with ``fields = "__all__"``.
+    """
+
+    fields = ()
+
+    def __init__(self, queryset, context=None):
+        # Either a queryset or rows already fetched with ``values(*fields)``,
+        # such as a page of them
+        self.queryset = queryset
+        self.context = context or {}
+
+    def get_rows(self):
+        if isinstance(self.queryset, QuerySet):
+            return list(self.queryset.values(*self.fields))
+        return list(self.queryset)
+
+    def to_representation(self, row):
+        return row
+
+    @property
+    def data(self):
+        return [self.to_representation(row) for row in self.get_rows()]
+
+
+class ImageValuesSerializer(ValuesSerializer):
+    fields = ("id", "image", "status", "size", "user")
+
+    def get_rows(self):
+        rows = super().get_rows()
+
+        # Fetch the annotation ids of every image in a single query, in
+        # Annotation order like ImageSerializer
+        annotations = {row["id"]: [] for row in rows}
+        through = Image.annotation.through.objects.filter(
+            image_id__in=list(annotations)
+        )
+        for image_id, annotation_id in through.order_by("annotation_id").values_list(
+            "image_id", "annotation_id"
+        ):
+            annotations[image_id].append(annotation_id)
+
+        for row in rows:
+            row["annotation"] = annotations[row["id"]]
+        return rows
+
+    def to_representation(self, row):
+        name = row["image"]
+        if name:
+            url = default_storage.url(name)
+            request = self.context.get("request")
+            row["image"] = request.build_absolute_uri(url) if request else url
+        else:
+            row["image"] = None
+        return row
+
+
+class CommentValuesSerializer(ValuesSerializer):
+    fields = ("id", "text", "created_at", "sentiment", "image", "user")
+    created_at = serializers.DateTimeField()
+
+    def to_representation(self, row):
+        row["created_at"] = self.created_at.to_representation(row["created_at"])
+        return row
+
+
+class CommentTrendQuerySerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(
+        choices=CommentRollup.GRANULARITY_CHOICES, default="day"
+    )
+    days = serializers.IntegerField(min_value=1, max_value=365, default=30)
+
+
+class CommentTrendBucketSerializer(serializers.Serializer):
+    bucket = serializers.DateTimeField()
+    comment_count = serializers.IntegerField()
+    user_count = serializers.IntegerField()
+    sentiment_sum = serializers.FloatField()
+    sentiment = serializers.FloatField()
+
+
+class CommentTrendSerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=CommentRollup.GRANULARITY_CHOICES)
+    since = serializers.DateTimeField()
+    comment_count = serializers.IntegerField()
+    sentiment = serializers.FloatField(allow_null=True)
+    buckets = CommentTrendBucketSerializer(many=True)
+
+
+class ImageStatusCountsSerializer(serializers.Serializer):
+    queued = serializers.IntegerField()
+    processing = serializers.IntegerField()
+    success = serializers.IntegerField()
+    fail = serializers.IntegerField()
+    total = serializers.IntegerField()
+
+
+class UserStatsSerializer(serializers.Serializer):
+    images = ImageStatusCountsSerializer()
+    comments_made = serializers.IntegerField()
+    comments_received = serializers.IntegerField()
+    storage_bytes = serializers.IntegerField()
+
+
+class TokenCacheStatsSerializer(serializers.Serializer):
+    size = serializers.IntegerField()
+    max_size = serializers.IntegerField()
+    ttl = serializers.FloatField()
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    evictions = serializers.IntegerField()
@@ -0,0 +1,211 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Comment, Image, UserStats
+from .rollups import cascaded_comments
+
+COUNTER_FIELDS = [
+    *UserStats.STATUS_FIELDS,
+    "comments_made",
+    "comments_received",
+    "storage_bytes",
+]
+
+
+@receiver(pre_save, sender=Image)
+def remember_image(instance, raw=False, **kwargs):
+    # post_save handlers may change instance.status before ours runs
+    instance._stats_status = instance.status
+    instance._stats_previous = None
+    if instance.pk is not None and not raw:
+        instance._stats_previous = (
+            Image.objects.filter(pk=instance.pk)
+            .values("user_id", "status", "size")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Image)
+def count_saved_image(instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    status = instance._stats_status
+    previous = instance._stats_previous
+    if created or previous is None:
+        UserStats.add({instance.user_id: {status: 1, "storage_bytes": instance.size}})
+        return
+
+    # Move the image from the stored owner, status and size to the new ones
+    deltas = {}
+    changes = [
+        (previous["user_id"], {previous["status"]: -1}, -previous["size"]),
+        (instance.user_id, {status: 1}, instance.size),
+    ]
+    if previous["user_id"] != instance.user_id:
+        received = instance.comments.count()
+        changes[0][1]["comments_received"] = -received
+        changes[1][1]["comments_received"] = received
+    for user_id, fields, size in changes:
+        user = deltas.setdefault(user_id, {})
+        for field, delta in [*fields.items(), ("storage_bytes", size)]:
+            user[field] = user.get(field, 0) + delta
+    UserStats.add(deltas)
+
+
+@receiver(pre_delete, sender=Image)
+def remember_deleted_image(instance, **kwargs):
+    # Bulk status updates don't touch instances, so read the stored values
+    instance._stats_stored = (
+        Image.objects.filter(pk=instance.pk).values("user_id", "status", "size").first()
+    )
+
+
+@receiver(post_delete, sender=Image)
+def count_deleted_image(instance, **kwargs):
+    stored = getattr(instance, "_stats_stored", None)
+    if stored is not None:
+        UserStats.add(
+            {
+                stored["user_id"]: {
+                    stored["status"]: -1,
+                    "storage_bytes": -stored["size"],
+                }
+            },
+            create=False,
+        )
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.add(comment_deltas(instance.user_id, instance.image.user_id, 1))
+
+
+@receiver(pre_delete, sender=Comment)
+def remember_comment_owner(instance, origin=None, **kwargs):
+    # Comments deleted along with an image, a user or in bulk are counted
+    # all at once, when the first of them is about to be deleted
+    if origin is not None and origin is not instance:
+        removed = origin.__dict__.get("_stats_removed")
+        if not removed:
+            comments = cascaded_comments(origin)
+            if comments is not None:
+                removed = origin._stats_removed = uncount_comments(comments)
+        if removed and instance.pk in removed:
+            removed.discard(instance.pk)
+            instance._stats_removed = True
+            return
+
+    # The image may be deleted along with the comment
+    instance._stats_owner_id = (
+        Image.objects.filter(pk=instance.image_id)
+        .values_list("user_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(instance, **kwargs):
+    if getattr(instance, "_stats_removed", False):
+        return
+    owner_id = getattr(instance, "_stats_owner_id", None)
+    UserStats.add(comment_deltas(instance.user_id, owner_id, -1), create=False)
+
+
+def uncount_comments(comments):
+    """
+    Take ``comments``, which are about to be deleted, out of the counters of
+    their authors and image owners in a few grouped queries.
+
+    Returns the ids of the comments.
+    """
+    comment_ids = set(comments.values_list("pk", flat=True))
+    deltas = {}
+    made = comments.values("user_id").annotate(total=Count("pk")).order_by()
+    for row in made:
+        deltas.setdefault(row["user_id"], {})["comments_made"] = -row["total"]
+    received = comments.values("image__user_id").annotate(total=Count("pk")).order_by()
+    for row in received:
+        owner = deltas.setdefault(row["image__user_id"], {})
+        owner["comments_received"] = -row["total"]
+    UserStats.add(deltas, create=False)
+    return comment_ids
+
+
+def comment_deltas(user_id, owner_id, delta):
+    deltas = {user_id: {"comments_made": delta}}
+    if owner_id is not None:
+        deltas.setdefault(owner_id, {})["comments_received"] = delta
+    return deltas
+
+
+def user_counters(user_ids):
+    """
+    Count the actual activity of ``user_ids`` in a few grouped queries.
+    """
+    counters = {user_id: dict.fromkeys(COUNTER_FIELDS, 0) for user_id in user_ids}
+    images = (
+        Image.objects.filter(user_id__in=user_ids)
+        .values("user_id", "status")
+        .annotate(total=Count("pk"), size=Sum("size"))
+        .order_by()
+    )
+    for row in images:
+        counters[row["user_id"]][row["status"]] = row["total"]
+        counters[row["user_id"]]["storage_bytes"] += row["size"] or 0
+
+    made = (
+        Comment.objects.filter(user_id__in=user_ids)
+        .values("user_id")
+        .annotate(total=Count("pk"))
+        .order_by()
+    )
+    for row in made:
+        counters[row["user_id"]]["comments_made"] = row["total"]
+
+    received = (
+        Comment.objects.filter(image__user_id__in=user_ids)
+        .values("image__user_id")
+        .annotate(total=Count("pk"))
+        .order_by()
+    )
+    for row in received:
+        counters[row["image__user_id"]]["comments_received"] = row["total"]
+    return counters
+
+
+def reconcile_user_stats(batch_size=1000):
+    """
+    Recount the ``UserStats`` of every user, a batch of users at a time.
+
+    Only rows whose counters drifted are written. Returns the number of
+    users whose counters were repaired.
+    """
+    repaired = 0
+    user_ids = User.objects.order_by("pk").values_list("pk", flat=True)
+    last = 0
+    while True:
+        batch = list(user_ids.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return repaired
+        last = batch[-1]
+
+        with transaction.atomic():
+            existing = UserStats.objects.select_for_update().in_bulk(batch)
+            counters = user_counters(batch)
+            missing, drifted = [], []
+            for user_id, actual in counters.items():
+                stats = existing.get(user_id)
+                if stats is None:
+                    if any(actual.values()):
+                        missing.append(UserStats(user_id=user_id, **actual))
+                elif any(getattr(stats, f) != v for f, v in actual.items()):
+                    for field, value in actual.items():
+                        setattr(stats, field, value)
+                    drifted.append(stats)
+            UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+            UserStats.objects.bulk_update(drifted, COUNTER_FIELDS)
+        repaired += len(missing) + len(drifted)
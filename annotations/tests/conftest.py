@@ -0,0 +1,65 @@
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from ..models import Image
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(settings):
+    # New images are annotated without the random annotator's simulated wait
+    settings.ANNOTATION_BACKEND = {
+        "BACKEND": "annotations.annotators.RandomAnnotator",
+        "OPTIONS": {"min_sleep": 0, "max_sleep": 0},
+    }
+
+
+@pytest.fixture(autouse=True)
+def admission_store(settings, tmp_path):
+    # Upload token buckets are kept out of the project directory
+    settings.UPLOAD_ADMISSION = {
+        **settings.UPLOAD_ADMISSION,
+        "STORE_PATH": tmp_path / "admission.sqlite3",
+    }
+
+
+@pytest.fixture
+def test_user():
+    return User.objects.create_user(username="testuser", password="testpassword")
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(test_user):
+    client = APIClient()
+    client.force_authenticate(test_user)
+    return client
+
+
+@pytest.fixture
+def admin_api_client(admin_user):
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    return client
+
+
+@pytest.fixture
+def make_images():
+    """
+    Create images that are not annotated.
+
+    ``bulk_create`` skips post_save, so no annotation is scheduled and the
+    images keep the status they are created with.
+    """
+
+    def make_images(user, count=1, **fields):
+        return Image.objects.bulk_create(
+            Image(image=f"media/images/{i}.jpg", user=user, **fields)
+            for i in range(count)
+        )
+
+    return make_images
@@ -0,0 +1,86 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..admin import EstimatedCountPaginator
+from ..models import Annotation, Comment, Image, apply_annotations
+
+
+def create_images(count):
+    users = User.objects.bulk_create(
+        User(username=f"user{i}") for i in range(User.objects.count(), count + 1)
+    )
+    images = Image.objects.bulk_create(
+        Image(image=f"media/images/{i}.jpg", user=users[i % len(users)])
+        for i in range(count)
+    )
+    Comment.objects.bulk_create(
+        Comment(image=image, user=image.user, text="Nice shot") for image in images
+    )
+    return images
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url", ["/admin/annotations/image/", "/admin/annotations/comment/"]
+)
+def test_changelist_queries_do_not_grow_with_rows(admin_client, url):
+    create_images(5)
+    with CaptureQueriesContext(connection) as few:
+        assert admin_client.get(url).status_code == 200
+    create_images(50)
+    with CaptureQueriesContext(connection) as many:
+        assert admin_client.get(url).status_code == 200
+
+    assert len(many) == len(few)
+
+
+@pytest.mark.django_db
+def test_image_changelist_filters(admin_client):
+    images = create_images(3)
+    apply_annotations({images[0].pk: ["boat"], images[1].pk: ["boat", "ocean"]})
+    boat = Annotation.objects.get(annotation="boat")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = admin_client.get(
+            "/admin/annotations/image/",
+            {"status__exact": "processing", "annotation": boat.pk},
+        )
+
+    assert response.status_code == 200
+    assert list(response.context["cl"].result_list) == [images[1], images[0]]
+    assert not any("DISTINCT" in query["sql"] for query in queries)
+
+
+@pytest.mark.django_db
+def test_image_change_form_does_not_load_users(admin_client):
+    image = create_images(20)[0]
+
+    response = admin_client.get(f"/admin/annotations/image/{image.pk}/change/")
+
+    assert response.status_code == 200
+    assert b"admin-autocomplete" in response.content
+    assert response.content.count(b"<option") < 20
+
+
+@pytest.mark.django_db
+def test_estimated_count_paginator():
+    create_images(30)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+    paginator = EstimatedCountPaginator(Image.objects.order_by("pk"), 10)
+    paginator.threshold = 10
+    Image.objects.filter(pk__in=Image.objects.order_by("pk")[:5].values("pk")).delete()
+    # The estimate is stale until the next ANALYZE
+    assert paginator.count == 30
+
+    filtered = EstimatedCountPaginator(
+        Image.objects.filter(status="queued").order_by("pk"), 10
+    )
+    filtered.threshold = 10
+    assert filtered.count == 25
+
+    small = EstimatedCountPaginator(Image.objects.order_by("pk"), 10)
+    assert small.count == 25
@@ -0,0 +1,123 @@
+import io
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image as PILImage
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..admission import TokenBucketStore
+
+
+@pytest.fixture(autouse=True)
+def admission(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    settings.UPLOAD_ADMISSION = {
+        "STORE_PATH": tmp_path / "admission.sqlite3",
+        "USER_RATE": "1/min",
+        "USER_BURST": 2,
+        "GLOBAL_RATE": "10/min",
+        "GLOBAL_BURST": 3,
+        "MAX_QUEUED": 5,
+        "MAX_QUEUED_PER_USER": 2,
+        "QUEUE_RETRY_AFTER": 30,
+    }
+    return settings.UPLOAD_ADMISSION
+
+
+def upload(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    content = io.BytesIO()
+    PILImage.new("RGB", (8, 8)).save(content, "JPEG")
+    image = SimpleUploadedFile("upload.jpg", content.getvalue(), "image/jpeg")
+    return client.post(
+        "/images/create/", {"image": image, "user": user.pk}, format="multipart"
+    )
+
+
+def test_token_bucket_store(tmp_path):
+    now = [1000.0]
+    store = TokenBucketStore(tmp_path / "buckets.sqlite3", clock=lambda: now[0])
+    buckets = [("a", 0.5, 2), ("b", 1.0, 1)]
+
+    assert store.take(buckets) == 0
+    # "b" is empty, so "a" keeps its remaining token
+    assert store.take(buckets) == pytest.approx(1.0)
+    now[0] += 1
+    assert store.take(buckets) == 0
+    assert store.take([("a", 0.5, 2)]) == pytest.approx(1.0)
+
+    # Another store on the same file, as in another worker process, sees it
+    other = TokenBucketStore(tmp_path / "buckets.sqlite3", clock=lambda: now[0])
+    assert other.take([("a", 0.5, 2)]) == pytest.approx(1.0)
+
+
+def test_token_bucket_store_give_and_prune(tmp_path):
+    now = [1000.0]
+    store = TokenBucketStore(tmp_path / "buckets.sqlite3", clock=lambda: now[0])
+    store.take([("a", 0.5, 1)])
+    store.take([("b", 0.5, 1)])
+
+    store.give([("a", 0.5, 1), ("missing", 0.5, 1)])
+    assert store.take([("a", 0.5, 1)]) == 0
+
+    # "b" has refilled by now, so dropping it loses nothing
+    now[0] += 2
+    assert store.take([("a", 0.5, 1)]) == 0
+    store.prune(2)
+    keys = [key for (key,) in store.connection.execute("SELECT key FROM bucket")]
+    assert keys == ["a"]
+
+
+@pytest.mark.django_db
+def test_uploads_over_the_user_rate_are_rejected(test_user):
+    assert upload(test_user).status_code == status.HTTP_201_CREATED
+    assert upload(test_user).status_code == status.HTTP_201_CREATED
+
+    response = upload(test_user)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response["Retry-After"] == "60"
+
+    # Other users have their own bucket
+    other = User.objects.create_user(username="other", password="testpassword")
+    assert upload(other).status_code == status.HTTP_201_CREATED
+
+
+@pytest.mark.django_db
+def test_invalid_uploads_do_not_use_up_the_rate(test_user):
+    client = APIClient()
+    client.force_authenticate(test_user)
+    for _ in range(3):
+        response = client.post("/images/create/", {"user": test_user.pk})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    assert upload(test_user).status_code == status.HTTP_201_CREATED
+    assert upload(test_user).status_code == status.HTTP_201_CREATED
+
+
+@pytest.mark.django_db
+def test_uploads_over_the_global_rate_are_rejected(test_user):
+    users = [User.objects.create_user(username=f"user{i}") for i in range(4)]
+    responses = [upload(user).status_code for user in users]
+
+    assert responses == [201, 201, 201, 429]
+
+
+@pytest.mark.django_db
+def test_uploads_are_rejected_while_backlog_is_full(test_user, admission, make_images):
+    other = User.objects.create_user(username="other", password="testpassword")
+    make_images(test_user, 2)
+
+    response = upload(test_user)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response["Retry-After"] == "30"
+    assert upload(other).status_code == status.HTTP_201_CREATED
+
+    make_images(other, 3)
+    assert upload(other).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    admission["MAX_QUEUED"] = None
+    admission["MAX_QUEUED_PER_USER"] = None
+    assert upload(test_user).status_code == status.HTTP_201_CREATED
@@ -0,0 +1,112 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from PIL import Image as PILImage
+
+from ..annotators import (
+    HistogramAnnotator,
+    RandomAnnotator,
+    annotate_queued_images,
+    get_annotator,
+)
+from ..models import Image, annotate_images
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    (tmp_path / "images").mkdir()
+    return tmp_path
+
+
+def make_image(media_root, user, name, colour):
+    PILImage.new("RGB", (640, 480), colour).save(media_root / "images" / name)
+    return Image(image=f"images/{name}", user=user)
+
+
+@pytest.fixture
+def images(media_root, test_user):
+    return Image.objects.bulk_create(
+        [
+            make_image(media_root, test_user, "sea.jpg", (40, 100, 160)),
+            make_image(media_root, test_user, "woods.jpg", (50, 100, 40)),
+            Image(image="images/missing.jpg", user=test_user),
+            Image(image="", user=test_user),
+        ]
+    )
+
+
+def test_random_annotator_labels_every_image():
+    images = [Image(pk=pk) for pk in range(5)]
+
+    results = RandomAnnotator(min_sleep=0, max_sleep=0, batch_size=2).annotate(images)
+
+    assert sorted(results) == list(range(5))
+    assert all(len(labels) == 1 for labels in results.values())
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("workers", [0, 2])
+def test_histogram_annotator(images, workers):
+    annotator = HistogramAnnotator(workers=workers)
+    try:
+        results = annotator.annotate(images)
+    finally:
+        annotator.close()
+
+    sea, woods, missing, no_file = images
+    assert results == {
+        sea.pk: ["ocean"],
+        woods.pk: ["forest"],
+        missing.pk: [],
+        no_file.pk: [],
+    }
+
+
+@pytest.mark.django_db
+def test_annotate_images_with_configured_backend(settings, images):
+    settings.ANNOTATION_BACKEND = {
+        "BACKEND": "annotations.annotators.HistogramAnnotator",
+        "OPTIONS": {"workers": 0},
+    }
+    assert isinstance(get_annotator(), HistogramAnnotator)
+
+    annotate_images(images)
+
+    assert [image.status for image in images] == [
+        "processing",
+        "processing",
+        "fail",
+        "fail",
+    ]
+    assert list(images[0].annotation.values_list("annotation", flat=True)) == ["ocean"]
+
+
+@pytest.mark.django_db
+def test_queued_images_are_annotated_in_batches(settings, media_root, test_user):
+    settings.ANNOTATION_BACKEND = {
+        "BACKEND": "annotations.annotators.HistogramAnnotator",
+        "OPTIONS": {"workers": 0, "batch_size": 2},
+    }
+    images = [
+        make_image(media_root, test_user, f"sea{i}.jpg", (40, 100, 160))
+        for i in range(5)
+    ]
+    for image in images:
+        image.save()
+    # An image without a file fails instead of stopping the batch
+    Image.objects.filter(pk=images[1].pk).update(image="")
+
+    # Only the inline random backend annotates during the upload
+    assert set(Image.objects.values_list("status", flat=True)) == {"queued"}
+
+    out = StringIO()
+    call_command("annotate_images", limit=3, stdout=out)
+    assert "annotated 3 images" in out.getvalue()
+    assert Image.objects.filter(status="queued").count() == 2
+
+    assert annotate_queued_images() == 2
+    statuses = Image.objects.order_by("pk").values_list("status", flat=True)
+    assert list(statuses) == ["processing", "fail", *["processing"] * 3]
+    assert annotate_queued_images() == 0
@@ -0,0 +1,108 @@
+import pytest
+from django.contrib.auth.models import User
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from ..authentication import CachedTokenAuthentication, LRUCache, token_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+@pytest.fixture
+def token(test_user):
+    return Token.objects.create(user=test_user)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_expires_entries():
+    now = [0]
+    cache = LRUCache(max_size=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+
+    now[0] = 9
+    assert cache.get("a") == 1
+    now[0] = 10
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.django_db
+def test_token_auth_is_cached(api_client, token, django_assert_num_queries):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    response = api_client.get("/images/")
+    assert response.status_code == status.HTTP_200_OK
+
+    # Only the image list query is left once the token is cached
+    with django_assert_num_queries(1):
+        response = api_client.get("/images/")
+    assert response.status_code == status.HTTP_200_OK
+    assert token_cache.stats()["hits"] == 1
+    assert token_cache.stats()["misses"] == 1
+
+
+@pytest.mark.django_db
+def test_revoked_token_is_rejected(api_client, token):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    api_client.get("/images/")
+
+    response = api_client.delete("/api/token/revoke/")
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = api_client.get("/images/")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+    assert token_cache.stats()["size"] == 0
+
+
+@pytest.mark.django_db
+def test_deactivated_user_is_rejected(api_client, test_user, token):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    api_client.get("/images/")
+
+    test_user.is_active = False
+    test_user.save()
+
+    response = api_client.get("/images/")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_token_cache_stats_requires_admin(api_client, test_user):
+    api_client.force_authenticate(test_user)
+    response = api_client.get("/api/token/cache/")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    admin = User.objects.create_superuser(username="admin", password="adminpassword")
+    api_client.force_authenticate(admin)
+    response = api_client.get("/api/token/cache/")
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.data) >= {"hits", "misses", "size"}
+
+
+@pytest.mark.django_db
+def test_cached_user_is_not_shared(token):
+    auth = CachedTokenAuthentication()
+    first, _ = auth.authenticate_credentials(token.key)
+    first.first_name = "changed"
+
+    second, cached_token = auth.authenticate_credentials(token.key)
+    assert second is not first
+    assert second.first_name == ""
+    assert cached_token.user is second
+    assert token_cache.stats()["hits"] == 1
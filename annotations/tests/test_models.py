@@ -0,0 +1,87 @@
+import pytest
+
+from ..models import Annotation, Image, apply_annotations, annotate_images
+
+
+@pytest.fixture
+def images(test_user, make_images):
+    return make_images(test_user, 10)
+
+
+def all_labels():
+    return [value for value, _ in Annotation.EXISTING_ANNOTATIONS]
+
+
+@pytest.mark.django_db
+def test_apply_annotations_updates_status(images):
+    done, partial, untouched = images[0], images[1], images[2]
+
+    apply_annotations({done.pk: all_labels(), partial.pk: ["boat", "boat"]})
+
+    statuses = dict(Image.objects.values_list("pk", "status"))
+    assert statuses[done.pk] == "success"
+    assert statuses[partial.pk] == "processing"
+    assert statuses[untouched.pk] == "queued"
+    assert list(partial.annotation.values_list("annotation", flat=True)) == ["boat"]
+
+
+@pytest.mark.django_db
+def test_apply_annotations_query_count_is_fixed(images, django_assert_num_queries):
+    Annotation.objects.create(annotation="boat")
+    results = {image.pk: all_labels() for image in images}
+
+    # annotation lookup, missing annotations, links, status transitions,
+    # status update and the two user stats queries
+    with django_assert_num_queries(7):
+        apply_annotations(results)
+
+    assert set(Image.objects.values_list("status", flat=True)) == {"success"}
+
+
+@pytest.mark.django_db
+def test_apply_annotations_is_idempotent(images):
+    image = images[0]
+    apply_annotations({image.pk: all_labels()})
+    apply_annotations({image.pk: all_labels()})
+
+    assert image.annotation.count() == len(Annotation.EXISTING_ANNOTATIONS)
+
+
+@pytest.mark.django_db
+def test_status_is_not_moved_back(images):
+    image = images[0]
+    Image.objects.filter(pk=image.pk).update(status="fail")
+
+    apply_annotations({image.pk: ["boat"]})
+
+    image.refresh_from_db()
+    assert image.status == "fail"
+
+
+@pytest.mark.django_db
+def test_annotate_images_annotates_every_image(images):
+    annotate_images(images)
+
+    assert Image.annotation.through.objects.count() == len(images)
+    assert set(Image.objects.values_list("status", flat=True)) == {"processing"}
+
+
+@pytest.mark.django_db
+def test_created_image_is_annotated_once(test_user):
+    image = Image.objects.create(image="media/images/new.jpg", user=test_user)
+
+    # The status change must not trigger another round of annotation
+    image.save()
+    assert image.annotation.count() == 1
+    assert image.status == "processing"
+
+
+@pytest.mark.django_db
+def test_annotation_add_updates_status(images):
+    image = images[0]
+    for value in all_labels():
+        image.annotation.add(Annotation.objects.create(annotation=value))
+        image.refresh_from_db()
+        assert image.status in ("processing", "success")
+
+    assert image.status == "success"
@@ -0,0 +1,104 @@
+import pytest
+from rest_framework import status
+
+from ..models import Annotation, Image, apply_annotations, moderate_annotations
+
+
+@pytest.fixture
+def images(test_user, make_images):
+    images = make_images(test_user, 200)
+    labels = [value for value, _ in Annotation.EXISTING_ANNOTATIONS]
+    apply_annotations({image.pk: labels for image in images[:100]})
+    apply_annotations({image.pk: ["ocean"] for image in images[100:150]})
+    return images
+
+
+def labels_of(image):
+    return set(image.annotation.values_list("annotation", flat=True))
+
+
+@pytest.mark.django_db
+def test_moderate_annotations_recomputes_status(images):
+    complete, ocean, queued = images[0], images[100], images[150]
+    Image.objects.filter(pk=queued.pk).update(status="fail")
+
+    moderate_annotations([complete.pk, ocean.pk, queued.pk, 0], remove=["ocean"])
+
+    statuses = dict(Image.objects.values_list("pk", "status"))
+    assert statuses[complete.pk] == "processing"
+    assert statuses[ocean.pk] == "queued"
+    assert statuses[queued.pk] == "fail"
+    assert labels_of(complete) == {"boat", "mountain", "plains", "forest"}
+    assert labels_of(ocean) == set()
+
+
+@pytest.mark.django_db
+def test_moderate_annotations_adds_and_removes(images):
+    image_ids = [image.pk for image in images]
+
+    moderate_annotations(image_ids, add=["boat", "forest"], remove=["ocean"])
+
+    assert labels_of(images[0]) == {"boat", "mountain", "plains", "forest"}
+    assert labels_of(images[100]) == {"boat", "forest"}
+    assert labels_of(images[199]) == {"boat", "forest"}
+    assert set(Image.objects.values_list("status", flat=True)) == {"processing"}
+
+
+@pytest.mark.django_db
+def test_bulk_annotation_view_query_budget(
+    admin_api_client, images, django_assert_max_num_queries
+):
+    payload = {
+        "images": [image.pk for image in images],
+        "add": ["boat", "mountain", "plains", "forest"],
+        "remove": ["ocean"],
+    }
+
+    # Images, annotations, delete, insert, status transitions, status update,
+    # user stats and savepoints
+    with django_assert_max_num_queries(10):
+        response = admin_api_client.post(
+            "/images/annotations/bulk/", payload, format="json"
+        )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == {"images": 200}
+    assert Image.objects.filter(status="processing").count() == 200
+
+
+@pytest.mark.django_db
+def test_bulk_annotation_view_requires_admin(user_client, images):
+    response = user_client.post(
+        "/images/annotations/bulk/",
+        {"images": [images[0].pk], "add": ["boat"]},
+        format="json",
+    )
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+def test_bulk_annotation_view_validation(admin_api_client, images):
+    url = "/images/annotations/bulk/"
+
+    response = admin_api_client.post(url, {"images": [images[0].pk]}, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = admin_api_client.post(
+        url, {"images": [images[0].pk], "add": ["cat"]}, format="json"
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_admin_moderation_action(admin_client, images):
+    response = admin_client.post(
+        "/admin/annotations/image/",
+        {
+            "action": "add_boat_annotation",
+            "_selected_action": [images[150].pk, images[151].pk],
+        },
+    )
+
+    assert response.status_code == 302
+    assert labels_of(images[150]) == {"boat"}
+    assert Image.objects.get(pk=images[151].pk).status == "processing"
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+
+from ..models import Comment, CommentRollup, Image
+from ..rollups import rebuild_comment_rollups
+
+
+@pytest.fixture
+def users():
+    return [
+        User.objects.create_user(username=f"user{i}", password="testpassword")
+        for i in range(2)
+    ]
+
+
+@pytest.fixture
+def images(users, make_images):
+    return make_images(users[0], 2)
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2026, 10, day, hour, minute, tzinfo=dt_timezone.utc)
+
+
+def rollup(image, granularity, bucket):
+    return CommentRollup.objects.get(
+        image=image, granularity=granularity, bucket=bucket
+    )
+
+
+@pytest.mark.django_db
+def test_comments_are_rolled_up(users, images):
+    image, other = images
+    Comment.objects.create(image=image, user=users[0], text="Great", created_at=at(9))
+    Comment.objects.create(
+        image=image, user=users[0], text="Awful", created_at=at(9, 30)
+    )
+    Comment.objects.create(image=image, user=users[1], text="Ok", created_at=at(11))
+    Comment.objects.create(image=other, user=users[1], text="Great", created_at=at(11))
+
+    hour = rollup(image, "hour", at(9))
+    assert (hour.comment_count, hour.user_count) == (2, 1)
+    assert hour.sentiment_sum == pytest.approx(0.8 - 1.0)
+
+    day = rollup(image, "day", at(0))
+    assert (day.comment_count, day.user_count) == (3, 2)
+
+    total = rollup(None, "day", at(0))
+    assert (total.comment_count, total.user_count) == (4, 2)
+    assert CommentRollup.objects.filter(image=None, granularity="day").count() == 1
+
+
+@pytest.mark.django_db
+def test_deleted_comments_leave_rollups(users, images):
+    image = images[0]
+    first = Comment.objects.create(
+        image=image, user=users[0], text="Great", created_at=at(9)
+    )
+    second = Comment.objects.create(
+        image=image, user=users[0], text="Great", created_at=at(10)
+    )
+
+    first.delete()
+    day = rollup(image, "day", at(0))
+    assert (day.comment_count, day.user_count) == (1, 1)
+    assert rollup(image, "hour", at(9)).user_count == 0
+
+    second.delete()
+    day.refresh_from_db()
+    assert (day.comment_count, day.user_count, day.sentiment_sum) == (0, 0, 0)
+
+
+@pytest.mark.django_db
+def test_edited_comments_move_between_rollups(users, images):
+    comment = Comment.objects.create(
+        image=images[0], user=users[0], text="Great", created_at=at(9)
+    )
+
+    comment.text = "Awful"
+    comment.created_at = at(9, day=2)
+    comment.save()
+
+    assert rollup(images[0], "day", at(0)).comment_count == 0
+    moved = rollup(images[0], "day", at(0, day=2))
+    assert (moved.comment_count, moved.sentiment_sum) == (1, -1.0)
+
+
+@pytest.mark.django_db
+def test_comment_trend_views(user_client, users, images, django_assert_num_queries):
+    now = timezone.now()
+    for days_ago in (0, 0, 3, 40):
+        Comment.objects.create(
+            image=images[0],
+            user=users[0],
+            text="Great",
+            created_at=now - timedelta(days=days_ago),
+        )
+    Comment.objects.create(image=images[1], user=users[1], text="Awful")
+
+    with django_assert_num_queries(2):
+        response = user_client.get(f"/images/{images[0].pk}/comments/trends/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["comment_count"] == 3
+    assert response.data["sentiment"] == pytest.approx(0.8)
+    assert [b["comment_count"] for b in response.data["buckets"]] == [1, 2]
+
+    response = user_client.get("/comments/trends/", {"granularity": "hour", "days": 1})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["comment_count"] == 3
+    assert response.data["buckets"][-1]["user_count"] == 2
+
+
+@pytest.mark.django_db
+def test_comment_trend_view_validation(user_client):
+    response = user_client.get("/comments/trends/", {"granularity": "week"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = user_client.get("/images/99/comments/trends/")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def rollup_totals():
+    return {
+        (r.image_id, r.granularity, r.bucket): (
+            r.comment_count,
+            r.user_count,
+            pytest.approx(r.sentiment_sum),
+        )
+        for r in CommentRollup.objects.exclude(comment_count=0)
+    }
+
+
+def comment_on(images, users):
+    for day in (1, 2):
+        for image in images:
+            for user in users:
+                Comment.objects.create(
+                    image=image, user=user, text="Great", created_at=at(9, day=day)
+                )
+                Comment.objects.create(
+                    image=image, user=user, text="Awful", created_at=at(10, day=day)
+                )
+
+
+def rollup_queries(queries):
+    return [query for query in queries if "commentrollup" in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_cascaded_deletes_are_rolled_up_at_once(users, images):
+    comment_on(images, users)
+    other = Image.objects.bulk_create(
+        [Image(image="media/images/other.jpg", user=users[1])]
+    )[0]
+    Comment.objects.create(image=other, user=users[1], text="Ok", created_at=at(9))
+
+    # The rollups are updated in a fixed number of queries, not per comment
+    with CaptureQueriesContext(connection) as queries:
+        images[0].delete()
+    assert len(rollup_queries(queries)) <= 10
+    with CaptureQueriesContext(connection) as queries:
+        users[0].delete()
+    assert len(rollup_queries(queries)) <= 10
+
+    remaining = rollup_totals()
+    rebuild_comment_rollups()
+    assert rollup_totals() == remaining
+    assert rollup(None, "day", at(0)).user_count == 1
+
+
+@pytest.mark.django_db
+def test_rebuild_comment_rollups(users, images):
+    comment_on(images, users)
+    expected = rollup_totals()
+
+    # Comments the signals never saw
+    Comment.objects.bulk_create(
+        [Comment(image=images[0], user=users[0], text="Great", created_at=at(9))]
+    )
+    CommentRollup.objects.all().delete()
+
+    out = StringIO()
+    call_command("rebuild_comment_rollups", stdout=out)
+    assert "Rolled up 17 comments" in out.getvalue()
+
+    hour = rollup(images[0], "hour", at(9))
+    assert (hour.comment_count, hour.user_count) == (3, 2)
+    assert hour.sentiment_sum == pytest.approx(3 * 0.8)
+    expected[images[0].pk, "hour", at(9)] = (3, 2, pytest.approx(2.4))
+    expected[images[0].pk, "day", at(0)] = (5, 2, pytest.approx(0.8 * 3 - 2))
+    expected[None, "hour", at(9)] = (5, 2, pytest.approx(4.0))
+    expected[None, "day", at(0)] = (9, 2, pytest.approx(0.8 * 5 - 4))
+    assert rollup_totals() == expected
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from ..models import Annotation, Image, Comment
+from ..renderers import ORJSONRenderer
+from ..serializers import (
+    ImageSerializer,
+    ImageValuesSerializer,
+    CommentSerializer,
+    CommentValuesSerializer,
+)
+from ..views import ImageListView
+
+
+@pytest.fixture
+def images(test_user, make_images):
+    images = [
+        *make_images(test_user),
+        *make_images(test_user, status="processing"),
+    ]
+    boat = Annotation.objects.create(annotation="boat")
+    ocean = Annotation.objects.create(annotation="ocean")
+    # Added out of pk order, the ids are still listed in Annotation order
+    images[1].annotation.add(ocean)
+    images[1].annotation.add(boat)
+    Comment.objects.bulk_create(
+        [Comment(image=image, user=test_user, text="Nice shot") for image in images]
+    )
+    return images
+
+
+@pytest.mark.django_db
+def test_image_values_serializer_matches_model_serializer(images):
+    request = APIRequestFactory().get("/images/")
+    context = {"request": request}
+    queryset = Image.objects.order_by("pk")
+
+    expected = ImageSerializer(queryset, many=True, context=context).data
+    assert ImageValuesSerializer(queryset, context=context).data == expected
+
+
+@pytest.mark.django_db
+def test_image_values_serializer_query_count(images, django_assert_num_queries):
+    with django_assert_num_queries(2):
+        ImageValuesSerializer(Image.objects.all()).data
+
+
+@pytest.mark.django_db
+def test_comment_values_serializer_matches_model_serializer(images):
+    queryset = Comment.objects.order_by("pk")
+
+    expected = CommentSerializer(queryset, many=True).data
+    assert CommentValuesSerializer(queryset).data == expected
+
+
+def test_orjson_renderer_matches_json_renderer():
+    data = {"text": "line\u2028break", "ids": [1, 2], 3: None}
+
+    rendered = ORJSONRenderer().render(data)
+    assert rendered == JSONRenderer().render(data)
+    assert json.loads(rendered) == {"text": "line\u2028break", "ids": [1, 2], "3": None}
+
+
+@pytest.mark.django_db
+def test_values_list_view_paginates(images, monkeypatch):
+    monkeypatch.setattr(ImageListView, "pagination_class", LimitOffsetPagination)
+    client = APIClient()
+    client.force_authenticate(user=images[0].user)
+
+    response = client.get("/images/", {"limit": 1, "offset": 1})
+    assert response.status_code == 200
+    assert response.data["count"] == 2
+    assert [row["id"] for row in response.data["results"]] == [images[1].pk]
+    assert response.data["results"][0]["annotation"] == list(
+        images[1].annotation.order_by("pk").values_list("pk", flat=True)
+    )
@@ -0,0 +1,168 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from ..models import Comment, Image, UserStats, moderate_annotations
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_user(username="owner", password="testpassword")
+
+
+@pytest.fixture
+def commenter():
+    return User.objects.create_user(username="commenter", password="testpassword")
+
+
+def counters(user):
+    stats = UserStats.objects.get(user=user)
+    return {
+        field: getattr(stats, field)
+        for field in [*UserStats.STATUS_FIELDS, "comments_made", "comments_received"]
+        if getattr(stats, field)
+    }
+
+
+@pytest.mark.django_db
+def test_counters_follow_uploads_and_transitions(owner):
+    first = Image.objects.create(image="media/images/a.jpg", user=owner)
+    second = Image.objects.create(image="media/images/b.jpg", user=owner)
+
+    # Every new image gets annotated right away
+    assert counters(owner) == {"processing": 2}
+
+    moderate_annotations(
+        [first.pk], add=["boat", "mountain", "plains", "ocean", "forest"]
+    )
+    assert counters(owner) == {"processing": 1, "success": 1}
+
+    moderate_annotations([second.pk], remove=["boat", "mountain", "plains"])
+    moderate_annotations([second.pk], remove=["ocean", "forest"])
+    assert counters(owner) == {"queued": 1, "success": 1}
+
+    second.delete()
+    assert counters(owner) == {"success": 1}
+
+
+@pytest.mark.django_db
+def test_counters_follow_comments(owner, commenter):
+    image = Image.objects.create(image="media/images/a.jpg", user=owner)
+    comment = Comment.objects.create(image=image, user=commenter, text="Nice")
+    Comment.objects.create(image=image, user=owner, text="Thanks")
+
+    assert counters(commenter) == {"comments_made": 1}
+    assert counters(owner) == {
+        "processing": 1,
+        "comments_made": 1,
+        "comments_received": 2,
+    }
+
+    comment.delete()
+    assert counters(commenter) == {}
+    assert counters(owner)["comments_received"] == 1
+
+    # Deleting the image takes its comments with it
+    image.delete()
+    assert counters(owner) == {}
+
+
+@pytest.mark.django_db
+def test_reconcile_user_stats_repairs_drift(owner, commenter, capsys):
+    image = Image.objects.create(image="media/images/a.jpg", user=owner)
+    Comment.objects.create(image=image, user=commenter, text="Nice")
+    Image.objects.filter(pk=image.pk).update(size=1234)
+    UserStats.objects.filter(user=commenter).delete()
+    UserStats.objects.filter(user=owner).update(processing=7, queued=-2)
+
+    call_command("reconcile_user_stats", batch_size=1)
+
+    assert "Repaired the counters of 2 users." in capsys.readouterr().out
+    assert counters(owner) == {"processing": 1, "comments_received": 1}
+    assert UserStats.objects.get(user=owner).storage_bytes == 1234
+    assert counters(commenter) == {"comments_made": 1}
+
+    call_command("reconcile_user_stats")
+    assert "Repaired the counters of 0 users." in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_user_stats_view(owner, commenter, django_assert_num_queries):
+    image = Image.objects.create(image="media/images/a.jpg", user=owner)
+    Comment.objects.create(image=image, user=commenter, text="Nice")
+    client = APIClient()
+
+    client.force_authenticate(owner)
+    with django_assert_num_queries(1):
+        response = client.get("/user/stats/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data == {
+        "images": {
+            "queued": 0,
+            "processing": 1,
+            "success": 0,
+            "fail": 0,
+            "total": 1,
+        },
+        "comments_made": 0,
+        "comments_received": 1,
+        "storage_bytes": 0,
+    }
+
+    client.force_authenticate(User.objects.create_user(username="new"))
+    response = client.get("/user/stats/")
+    assert response.data["images"]["total"] == 0
+
+
+@pytest.mark.django_db
+def test_counters_follow_owner_and_file_changes(owner, commenter, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    (tmp_path / "small.jpg").write_bytes(b"x" * 500)
+    (tmp_path / "large.jpg").write_bytes(b"x" * 800)
+    image = Image.objects.create(image="small.jpg", user=owner)
+    Comment.objects.create(image=image, user=commenter, text="Nice")
+
+    image = Image.objects.get(pk=image.pk)
+    image.user = commenter
+    image.save()
+    assert counters(owner) == {}
+    assert counters(commenter) == {
+        "processing": 1,
+        "comments_made": 1,
+        "comments_received": 1,
+    }
+    assert UserStats.objects.get(user=owner).storage_bytes == 0
+    assert UserStats.objects.get(user=commenter).storage_bytes == 500
+
+    image.image = "large.jpg"
+    image.save()
+    assert Image.objects.get(pk=image.pk).size == 800
+    assert UserStats.objects.get(user=commenter).storage_bytes == 800
+
+
+@pytest.mark.django_db
+def test_cascaded_comment_deletes_are_counted_at_once(
+    owner, commenter, django_assert_max_num_queries
+):
+    def comment(count):
+        image = Image.objects.create(image="media/images/a.jpg", user=owner)
+        Comment.objects.bulk_create(
+            Comment(image=image, user=commenter, text="Nice") for _ in range(count)
+        )
+        # bulk_create skips the signals, so count the comments directly
+        call_command("reconcile_user_stats")
+        call_command("rebuild_comment_rollups")
+        return image
+
+    few, many = comment(2), comment(100)
+    with CaptureQueriesContext(connection) as queries:
+        few.delete()
+    with django_assert_max_num_queries(len(queries)):
+        many.delete()
+
+    assert counters(owner) == {}
+    assert counters(commenter) == {}
@@ -0,0 +1,118 @@
+import io
+
+import pytest
+from PIL import Image as PILImage
+from rest_framework import status
+
+from ..models import Image
+from ..tiles import TileCache, TilePyramid
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    settings.TILE_CACHE_ROOT = tmp_path / "tiles"
+    (tmp_path / "media" / "images").mkdir(parents=True)
+    return settings.MEDIA_ROOT
+
+
+@pytest.fixture
+def picture(media_root):
+    path = media_root / "images" / "large.jpg"
+    PILImage.new("RGB", (1000, 600), (40, 100, 160)).save(path)
+    return path
+
+
+@pytest.fixture
+def test_image(picture, test_user):
+    image = Image(image="images/large.jpg", user=test_user)
+    return Image.objects.bulk_create([image])[0]
+
+
+def test_pyramid_geometry(picture, tmp_path):
+    pyramid = TilePyramid(picture, tmp_path / "tiles", tile_size=254, overlap=1)
+
+    assert pyramid.max_level == 10
+    assert pyramid.level_size(10) == (1000, 600)
+    assert pyramid.level_size(9) == (500, 300)
+    assert pyramid.level_size(0) == (1, 1)
+    assert pyramid.level_tiles(10) == (4, 3)
+    assert pyramid.tile_box(10, 0, 0) == (0, 0, 255, 255)
+    assert pyramid.tile_box(10, 3, 2) == (761, 507, 1000, 600)
+    assert not pyramid.has_tile(10, 4, 0)
+    assert not pyramid.has_tile(11, 0, 0)
+
+
+def test_level_is_rendered_once(picture, tmp_path):
+    pyramid = TilePyramid(picture, tmp_path / "tiles")
+
+    path = pyramid.tile_path(9, 1, 0)
+    assert sorted(p.name for p in path.parent.iterdir()) == [
+        "0_0.jpg",
+        "0_1.jpg",
+        "1_0.jpg",
+        "1_1.jpg",
+    ]
+    with PILImage.open(path) as tile:
+        assert tile.size == (500 - 253, 255)
+
+    mtime = path.stat().st_mtime_ns
+    pyramid.tile_path(9, 0, 0)
+    assert path.stat().st_mtime_ns == mtime
+
+
+def test_cache_evicts_least_recently_used_levels(picture, tmp_path):
+    cache = TileCache(tmp_path / "tiles", max_bytes=0)
+    pyramid = TilePyramid(picture, tmp_path / "tiles" / "1")
+
+    cache.tile_path(pyramid, 8, 0, 0)
+    cache.tile_path(pyramid, 9, 0, 0)
+
+    # Over budget, only the level that was just rendered is kept
+    assert not pyramid.level_dir(8).exists()
+    assert pyramid.level_dir(9).is_dir()
+
+
+@pytest.mark.django_db
+def test_tile_view(user_client, test_image):
+    response = user_client.get(f"/images/{test_image.pk}/tiles/10/3_2.jpg")
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "image/jpeg"
+    response.close()
+
+    response = user_client.get(f"/images/{test_image.pk}/tiles/10/4_0.jpg")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_tile_descriptor_view(user_client, test_image):
+    response = user_client.get(f"/images/{test_image.pk}/tiles.dzi")
+    assert response.status_code == status.HTTP_200_OK
+    assert b'<Size Width="1000" Height="600"/>' in response.content
+
+
+@pytest.mark.django_db
+def test_tiles_are_removed_with_image(user_client, test_image, settings):
+    user_client.get(f"/images/{test_image.pk}/tiles/0/0_0.jpg").close()
+    assert (settings.TILE_CACHE_ROOT / str(test_image.pk)).is_dir()
+
+    test_image.delete()
+    assert not (settings.TILE_CACHE_ROOT / str(test_image.pk)).exists()
+
+
+@pytest.mark.django_db
+def test_tiles_are_removed_when_file_is_replaced(user_client, test_image, media_root):
+    url = f"/images/{test_image.pk}/tiles/9/0_0.jpg"
+    user_client.get(url).close()
+
+    PILImage.new("RGB", (500, 300), (255, 0, 0)).save(media_root / "images/red.jpg")
+    image = Image.objects.get(pk=test_image.pk)
+    image.image = "images/red.jpg"
+    image.save()
+
+    response = user_client.get(url)
+    with PILImage.open(io.BytesIO(b"".join(response.streaming_content))) as tile:
+        red, green, blue = tile.convert("RGB").getpixel((0, 0))
+    assert red > 200 and green < 50 and blue < 50
+    response = user_client.get(f"/images/{test_image.pk}/tiles.dzi")
+    assert b'<Size Width="500" Height="300"/>' in response.content
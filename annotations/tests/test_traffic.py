@@ -0,0 +1,129 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from ..management.commands.replay_traffic import percentile
+from ..middleware import read_traffic_log, redact
+
+
+@pytest.fixture
+def traffic_log(settings, tmp_path):
+    settings.TRAFFIC_CAPTURE = {"ENABLED": True, "PATH": tmp_path / "traffic.jsonl"}
+    return settings.TRAFFIC_CAPTURE["PATH"]
+
+
+def test_redact():
+    assert redact("Secret") == "xxxxxx"
+    assert redact("42") == "11"
+    assert redact({"text": "Hi", "ids": [7, 8.5], "flag": True, "none": None}) == {
+        "text": "xx",
+        "ids": [1, 1.0],
+        "flag": True,
+        "none": None,
+    }
+
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 90) == 7
+    assert percentile([], 50) == 0
+
+
+@pytest.mark.django_db
+def test_traffic_is_captured(traffic_log, test_user, make_images):
+    image = make_images(test_user)[0]
+    client = APIClient()
+    client.force_authenticate(test_user)
+
+    client.get("/images/", {"page": ["1", "12"], "search": "Private"})
+    client.post(f"/images/{image.pk}/comments/", {"text": "Secret opinion"})
+    client.post(
+        f"/images/{image.pk}/comments/", {"text": "Hidden remark"}, format="json"
+    )
+
+    listing, comment, json_comment = read_traffic_log(traffic_log)
+    assert listing["method"] == "GET"
+    assert listing["route"] == "images/"
+    assert listing["query"] == [["page", ["1", "11"]], ["search", ["xxxxxxx"]]]
+    assert listing["status"] == 200
+    assert listing["response_bytes"] > 0
+
+    assert comment["route"] == "images/<int:image_id>/comments/"
+    assert comment["kwargs"] == {"image_id": image.pk}
+    assert comment["fields"] == {"text": ["x" * len("Secret opinion")]}
+    assert comment["body"] is None
+    assert comment["request_bytes"] > 0
+    assert comment["status"] == 201
+
+    assert json_comment["body"] == {"text": "x" * len("Hidden remark")}
+    assert json_comment["status"] == 201
+    for secret in ["Private", "Secret opinion", "Hidden remark"]:
+        assert secret not in traffic_log.read_text()
+
+
+@pytest.mark.django_db
+def test_traffic_capture_is_disabled_by_default(settings, tmp_path, test_user):
+    settings.TRAFFIC_CAPTURE = {"ENABLED": False, "PATH": tmp_path / "traffic.jsonl"}
+    client = APIClient()
+    client.force_authenticate(test_user)
+
+    client.get("/images/")
+
+    assert not (tmp_path / "traffic.jsonl").exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replay_traffic(live_server, test_user, make_images, tmp_path, capsys):
+    token = Token.objects.create(user=test_user)
+    image = make_images(test_user)[0]
+    log = tmp_path / "traffic.jsonl"
+    records = [
+        dict(ts=100.0 + i / 100, method="GET", path=path, query=[], route=None)
+        for i, path in enumerate(["/images/", "/user/stats/", "/images/", "/nope/"])
+    ]
+    comment = dict(
+        ts=101.0, method="POST", path=f"/images/{image.pk}/comments/", query=[]
+    )
+    records += [
+        dict(
+            comment,
+            content_type="application/x-www-form-urlencoded",
+            fields={"text": ["xxxxx"]},
+            request_bytes=10,
+        ),
+        dict(
+            comment,
+            content_type="application/json",
+            body={"text": "xxxxx"},
+            request_bytes=17,
+        ),
+        # The body of other content types isn't captured
+        dict(comment, content_type="text/plain", request_bytes=5),
+    ]
+    log.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    call_command(
+        "replay_traffic",
+        str(log),
+        base_url=live_server.url,
+        token=token.key,
+        # The test database is SQLite, which would lock on concurrent writes
+        concurrency=1,
+        speedup=0,
+    )
+
+    replayed, skipped = capsys.readouterr().out.split("\n\n")
+    report = {line.split()[0]: line.split()[1:3] for line in replayed.splitlines()[1:]}
+    assert report["images/"] == ["2", "0"]
+    assert report["user/stats/"] == ["1", "0"]
+    assert report["images/<int:image_id>/comments/"] == ["2", "0"]
+    assert report["/nope/"] == ["1", "1"]
+    assert report["TOTAL"] == ["6", "1"]
+    assert skipped.splitlines()[1].split() == ["images/<int:image_id>/comments/", "1"]
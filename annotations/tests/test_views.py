@@ -1,6 +1,7 @@
 import pytest
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.management import call_command
 from rest_framework.test import APIClient
 from rest_framework import status
 from ..models import Image, Comment
@@ -126,3 +127,8 @@ def test_comment_delete_view(api_client, test_user, test_image):
     response = api_client.delete(comment_delete_url)
     assert response.status_code == status.HTTP_204_NO_CONTENT
     assert not Comment.objects.filter(id=new_comment.id).exists()
+
+
+def test_openapi_schema_has_no_warnings(tmp_path):
+    # Raises when any view can't be described
+    call_command("spectacular", "--fail-on-warn", "--file", tmp_path / "schema.yaml")
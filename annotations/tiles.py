@@ -0,0 +1,176 @@
+import math
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image as PILImage
+
+
+class TilePyramid:
+    """
+    DeepZoom tile pyramid of a single image, generated lazily on disk.
+
+    Level ``max_level`` is the original size and every level below halves it,
+    down to a single pixel at level 0. The tiles of a level are all rendered
+    the first time any of them is requested and kept under ``cache_dir`` until
+    ``TileCache`` evicts them.
+    """
+
+    def __init__(self, path, cache_dir, tile_size=254, overlap=1, quality=85):
+        self.path = path
+        self.cache_dir = Path(cache_dir)
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.quality = quality
+        with PILImage.open(path) as img:
+            self.width, self.height = img.size
+        self.max_level = math.ceil(math.log2(max(self.width, self.height, 1)))
+
+    def level_size(self, level):
+        scale = 2 ** (self.max_level - level)
+        return math.ceil(self.width / scale), math.ceil(self.height / scale)
+
+    def level_tiles(self, level):
+        width, height = self.level_size(level)
+        return math.ceil(width / self.tile_size), math.ceil(height / self.tile_size)
+
+    def tile_box(self, level, x, y):
+        width, height = self.level_size(level)
+        left = x * self.tile_size - (self.overlap if x else 0)
+        top = y * self.tile_size - (self.overlap if y else 0)
+        right = min(width, (x + 1) * self.tile_size + self.overlap)
+        bottom = min(height, (y + 1) * self.tile_size + self.overlap)
+        return left, top, right, bottom
+
+    def has_tile(self, level, x, y):
+        if not 0 <= level <= self.max_level:
+            return False
+        columns, rows = self.level_tiles(level)
+        return 0 <= x < columns and 0 <= y < rows
+
+    def level_dir(self, level):
+        return self.cache_dir / str(level)
+
+    def tile_path(self, level, x, y):
+        """
+        Return the path of a tile, rendering its level first if needed.
+        """
+        level_dir = self.level_dir(level)
+        if not level_dir.is_dir():
+            self.render_level(level)
+        else:
+            # Mark the level as recently used for eviction
+            os.utime(level_dir)
+        return level_dir / f"{x}_{y}.jpg"
+
+    def render_level(self, level):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        size = self.level_size(level)
+        columns, rows = self.level_tiles(level)
+
+        with PILImage.open(self.path) as img:
+            # Let the JPEG decoder downscale while decoding
+            img.draft("RGB", size)
+            img = img.convert("RGB")
+            if img.size != size:
+                img = img.resize(size, PILImage.LANCZOS, reducing_gap=2.0)
+
+            # Render into a scratch directory and move it in place in one step,
+            # so concurrent requests never see a partially written level
+            scratch = Path(tempfile.mkdtemp(dir=self.cache_dir))
+            for x in range(columns):
+                for y in range(rows):
+                    img.crop(self.tile_box(level, x, y)).save(
+                        scratch / f"{x}_{y}.jpg", "JPEG", quality=self.quality
+                    )
+
+        try:
+            os.rename(scratch, self.level_dir(level))
+        except OSError:
+            # Another worker rendered the same level first
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def descriptor(self):
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="jpg" Overlap="{self.overlap}" TileSize="{self.tile_size}">'
+            f'<Size Width="{self.width}" Height="{self.height}"/></Image>'
+        )
+
+
+class TileCache:
+    """
+    On-disk store of tile pyramids, kept under a byte budget.
+
+    Each image gets a directory under ``root`` with one subdirectory per
+    rendered level. When the budget is exceeded the least recently used
+    levels are removed.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+
+    def image_dir(self, image):
+        return self.root / str(image.pk)
+
+    def pyramid(self, image):
+        return TilePyramid(
+            image.image.path,
+            self.image_dir(image),
+            tile_size=getattr(settings, "TILE_SIZE", 254),
+            overlap=getattr(settings, "TILE_OVERLAP", 1),
+        )
+
+    def tile_path(self, pyramid, level, x, y):
+        """
+        Return the path of a tile, evicting old levels if one was rendered.
+        """
+        rendered = pyramid.level_dir(level).is_dir()
+        path = pyramid.tile_path(level, x, y)
+        if not rendered:
+            self.evict(keep=pyramid.level_dir(level))
+        return path
+
+    def levels(self):
+        if not self.root.is_dir():
+            return []
+        return [
+            level
+            for image_dir in self.root.iterdir()
+            if image_dir.is_dir()
+            for level in image_dir.iterdir()
+            if level.is_dir() and level.name.isdigit()
+        ]
+
+    def evict(self, keep=None):
+        levels = []
+        for level in self.levels():
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(level))
+                levels.append((level.stat().st_mtime, size, level))
+            except FileNotFoundError:
+                # Evicted by another worker in the meantime
+                continue
+
+        total = sum(size for _, size, _ in levels)
+        for _, size, level in sorted(levels, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            if level == keep:
+                continue
+            shutil.rmtree(level, ignore_errors=True)
+            total -= size
+
+    def remove(self, image):
+        shutil.rmtree(self.image_dir(image), ignore_errors=True)
+
+
+def get_tile_cache():
+    return TileCache(
+        getattr(settings, "TILE_CACHE_ROOT", Path(settings.BASE_DIR) / "tile_cache"),
+        getattr(settings, "TILE_CACHE_MAX_BYTES", 512 * 1024 * 1024),
+    )
@@ -1,19 +1,60 @@
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiResponse, extend_schema
 from rest_framework import generics, serializers
 from rest_framework.exceptions import PermissionDenied, NotFound
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from textblob import TextBlob
 
-from .models import Image, Comment
+from .admission import UploadRateThrottle, check_annotation_backlog
+from .authentication import token_cache
+from .models import Image, Comment, UserStats, moderate_annotations
+from .rollups import SPANS, comment_trend, truncate
+from .tiles import get_tile_cache
 from .serializers import (
     ImageSerializer,
     ImageCreateSerializer,
     CommentSerializer,
     CommentCreateSerializer,
+    ImageValuesSerializer,
+    CommentValuesSerializer,
+    BulkAnnotationSerializer,
+    CommentTrendQuerySerializer,
+    CommentTrendSerializer,
+    TokenCacheStatsSerializer,
+    UserStatsSerializer,
 )
 
 
-class ImageListView(generics.ListAPIView):
+class ValuesListMixin:
+    """
+    Serve ``list`` responses through a read-only ``ValuesSerializer``.
+
+    ``serializer_class`` is still used for the schema and any other action.
+    """
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+
+        # Paginate the values() rows, so a page never loads model instances
+        fields = self.values_serializer_class.fields
+        page = self.paginate_queryset(queryset.values(*fields))
+        if page is not None:
+            serializer = self.values_serializer_class(page, context=context)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.values_serializer_class(queryset, context=context)
+        return Response(serializer.data)
+
+
+class ImageListView(ValuesListMixin, generics.ListAPIView):
     """
     Get a list of images.
 
@@ -35,6 +76,7 @@ class ImageListView(generics.ListAPIView):
 
     queryset = Image.objects.all()
     serializer_class = ImageSerializer
+    values_serializer_class = ImageValuesSerializer
     permission_classes = [IsAuthenticated]
 
 
@@ -58,7 +100,10 @@ class ImageCreateView(generics.CreateAPIView):
     - 201 Created: Image successfully created.
     - 400 Bad Request: Invalid request parameters or missing image file.
     - 403 Forbidden: Authentication required.
+    - 429 Too Many Requests: Upload rate limit exceeded, see `Retry-After`.
     - 500 Internal Server Error: An unexpected error occurred.
+    - 503 Service Unavailable: Too many images are waiting for annotation,
+      see `Retry-After`.
 
     __Authorization__:
     - Only authenticated users can create new images.
@@ -68,6 +113,19 @@ class ImageCreateView(generics.CreateAPIView):
     queryset = Image.objects.all()
     serializer_class = ImageCreateSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UploadRateThrottle]
+
+    def check_throttles(self, request):
+        # Check the backlog first, so rejected uploads don't use up tokens
+        check_annotation_backlog(request.user)
+        super().check_throttles(request)
+
+    def handle_exception(self, exc):
+        response = super().handle_exception(exc)
+        # Invalid uploads don't count towards the rate limits
+        if response.status_code == 400:
+            UploadRateThrottle().refund(self.request)
+        return response
 
     def perform_create(self, serializer):
         if "image" not in self.request.data:
@@ -127,7 +185,7 @@ class ImageDetailView(generics.RetrieveAPIView):
 
             # Retrieve all comments related to the image
             comments_queryset = Comment.objects.filter(image=instance)
-            comments_serializer = CommentSerializer(comments_queryset, many=True)
+            comments_serializer = CommentValuesSerializer(comments_queryset)
 
             num_users_commented = (
                 Comment.objects.filter(image=instance).values("user").distinct().count()
@@ -207,7 +265,7 @@ class CommentCreateView(generics.CreateAPIView):
         serializer.save(image=image, user=self.request.user)
 
 
-class UserImagesListView(generics.ListAPIView):
+class UserImagesListView(ValuesListMixin, generics.ListAPIView):
     """
     Get a list of images uploaded by the authenticated user.
 
@@ -237,6 +295,7 @@ class UserImagesListView(generics.ListAPIView):
     """
 
     serializer_class = ImageSerializer
+    values_serializer_class = ImageValuesSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -244,6 +303,48 @@ class UserImagesListView(generics.ListAPIView):
         return Image.objects.filter(user=self.request.user)
 
 
+class UserStatsView(APIView):
+    """
+    Get activity statistics of the authenticated user.
+
+    This endpoint returns how many of the user's images are in each status,
+    how many comments they made and received and how much storage their
+    images use. It is served from counters kept up to date on every change,
+    so it does not scan the user's images or comments.
+
+    Example:
+    ```
+    GET /user/stats/
+    ```
+
+    __Status Codes:__
+    - 200 OK: Successful retrieval of the statistics.
+    - 403 Forbidden: Authentication required.
+
+    __Authorization__:
+    - All authenticated users can retrieve their own statistics.
+
+    """
+
+    serializer_class = UserStatsSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        stats = UserStats.objects.filter(user=request.user).first()
+        if stats is None:
+            stats = UserStats(user=request.user)
+
+        images = {status: getattr(stats, status) for status in UserStats.STATUS_FIELDS}
+        return Response(
+            dict(
+                images=dict(images, total=sum(images.values())),
+                comments_made=stats.comments_made,
+                comments_received=stats.comments_received,
+                storage_bytes=stats.storage_bytes,
+            )
+        )
+
+
 class ImageDeleteView(generics.DestroyAPIView):
     """
     Delete an image.
@@ -374,3 +475,305 @@ class AdminImageDeleteView(generics.DestroyAPIView):
         image_id = self.kwargs.get("image_id")
         image = generics.get_object_or_404(Image, pk=image_id)
         return image
+
+
+class CommentTrendMixin:
+    """
+    Answers comment trend queries from the ``CommentRollup`` buckets.
+    """
+
+    def get_image_id(self):
+        return None
+
+    @extend_schema(
+        parameters=[CommentTrendQuerySerializer], responses=CommentTrendSerializer
+    )
+    def get(self, request, *args, **kwargs):
+        query = CommentTrendQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        granularity = query.validated_data["granularity"]
+        days = query.validated_data["days"]
+
+        since = truncate(timezone.now() - SPANS["day"] * days, granularity)
+        buckets = list(comment_trend(self.get_image_id(), granularity, since))
+        for bucket in buckets:
+            bucket["sentiment"] = bucket["sentiment_sum"] / bucket["comment_count"]
+
+        comment_count = sum(bucket["comment_count"] for bucket in buckets)
+        sentiment_sum = sum(bucket["sentiment_sum"] for bucket in buckets)
+        return Response(
+            dict(
+                granularity=granularity,
+                since=since,
+                comment_count=comment_count,
+                sentiment=sentiment_sum / comment_count if comment_count else None,
+                buckets=buckets,
+            )
+        )
+
+
+class CommentTrendView(CommentTrendMixin, APIView):
+    """
+    Get the comment activity over all images.
+
+    This endpoint returns comment counts, distinct commenters and sentiment
+    per hour or day. It is served from precomputed rollups, so the cost does
+    not depend on the number of comments.
+
+    Example:
+    ```
+    GET /comments/trends/?granularity=day&days=30
+    ```
+
+    __Query Parameters__:
+    - granularity: `hour` or `day` (default `day`).
+    - days: How many days back to go, from 1 to 365 (default 30).
+
+    __Returns__: The buckets with comments, oldest first, and the comment
+    count and average sentiment over the whole period.
+
+    __Status Codes:__
+    - 200 OK: Successful retrieval of the trend.
+    - 400 Bad Request: Invalid query parameters.
+    - 403 Forbidden: Authentication required.
+
+    __Authorization__:
+    - All authenticated users can retrieve comment trends.
+
+    """
+
+    permission_classes = [IsAuthenticated]
+
+
+class ImageCommentTrendView(CommentTrendMixin, APIView):
+    """
+    Get the comment activity of a specific image.
+
+    This endpoint returns comment counts, distinct commenters and sentiment
+    per hour or day for one image, served from precomputed rollups.
+
+    Example:
+    ```
+    GET /images/{image_id}/comments/trends/?granularity=day&days=30
+    ```
+
+    __Query Parameters__:
+    - granularity: `hour` or `day` (default `day`).
+    - days: How many days back to go, from 1 to 365 (default 30).
+
+    __Returns__: The buckets with comments, oldest first, and the comment
+    count and average sentiment over the whole period.
+
+    __Status Codes:__
+    - 200 OK: Successful retrieval of the trend.
+    - 400 Bad Request: Invalid query parameters.
+    - 403 Forbidden: Authentication required.
+    - 404 Not Found: The requested image does not exist.
+
+    __Authorization__:
+    - All authenticated users can retrieve comment trends.
+
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get_image_id(self):
+        image_id = self.kwargs.get("image_id")
+        if not Image.objects.filter(pk=image_id).exists():
+            raise NotFound("Image not found")
+        return image_id
+
+
+class BulkAnnotationView(generics.GenericAPIView):
+    """
+    Add and remove annotations on many images at once.
+
+    This endpoint allows admin users to correct the annotations of up to
+    10000 images in one request. The changes are applied with set-based
+    statements and the status of every image is recomputed from its
+    annotations.
+
+    Example:
+    ```
+    POST /images/annotations/bulk/
+    Body: {'images': [1, 2, 3], 'add': ['boat'], 'remove': ['ocean']}
+    ```
+
+    __Returns__: The number of images changed. Unknown image ids are ignored.
+
+    __Status Codes:__
+    - 200 OK: Annotations successfully updated.
+    - 400 Bad Request: Invalid image ids or annotations.
+    - 403 Forbidden: Admin authentication required.
+
+    __Authorization__:
+    - Only admin users can moderate annotations.
+
+    """
+
+    serializer_class = BulkAnnotationSerializer
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        image_ids = moderate_annotations(
+            serializer.validated_data["images"],
+            add=serializer.validated_data["add"],
+            remove=serializer.validated_data["remove"],
+        )
+        return Response({"images": len(image_ids)})
+
+
+@extend_schema(responses={204: None})
+class TokenRevokeView(generics.DestroyAPIView):
+    """
+    Revoke the API token of the authenticated user.
+
+    This endpoint deletes the user's token. Requests using it are rejected
+    from then on; a new token can be requested from `/api/token/`.
+
+    Example:
+    ```
+    DELETE /api/token/revoke/
+    Headers: {'Authorization': 'Token <your_token>'}
+    ```
+
+    __Status Codes:__
+    - 204 No Content: Token successfully revoked.
+    - 403 Forbidden: Authentication required.
+    - 404 Not Found: The user has no token.
+
+    __Authorization__:
+    - All authenticated users can revoke their own token.
+
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        return generics.get_object_or_404(Token, user=self.request.user)
+
+
+class TokenCacheStatsView(APIView):
+    """
+    Get the token authentication cache statistics of this worker process.
+
+    __Returns__: The size, capacity, TTL and hit, miss and eviction counters
+    of the in-process cache of resolved API tokens.
+
+    Example:
+    ```
+    GET /api/token/cache/
+    ```
+
+    __Status Codes:__
+    - 200 OK: Successful retrieval of the statistics.
+    - 403 Forbidden: Admin authentication required.
+
+    __Authorization__:
+    - Only admin users can retrieve the statistics.
+
+    """
+
+    serializer_class = TokenCacheStatsSerializer
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(token_cache.stats())
+
+
+class ImageTileMixin:
+    def get_pyramid(self, cache):
+        image = generics.get_object_or_404(Image, pk=self.kwargs.get("pk"))
+        try:
+            return cache.pyramid(image)
+        except (OSError, ValueError):
+            raise NotFound("Image file not found or not readable.")
+
+
+class ImageTileDescriptorView(ImageTileMixin, APIView):
+    """
+    Get the DeepZoom descriptor of an image.
+
+    This endpoint describes the tile pyramid served by the tile endpoint, in
+    the `.dzi` format understood by DeepZoom viewers such as OpenSeadragon.
+
+    Example:
+    ```
+    GET /images/{image_id}/tiles.dzi
+    ```
+
+    __Status Codes:__
+    - 200 OK: Successful retrieval of the descriptor.
+    - 403 Forbidden: Authentication required.
+    - 404 Not Found: Image not found.
+
+    __Authorization__:
+    - All authenticated users can view any image.
+
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        responses={
+            (200, "application/xml"): OpenApiResponse(
+                OpenApiTypes.STR, description="DeepZoom image descriptor."
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        pyramid = self.get_pyramid(get_tile_cache())
+        return HttpResponse(pyramid.descriptor(), content_type="application/xml")
+
+
+class ImageTileView(ImageTileMixin, APIView):
+    """
+    Get a single tile of an image.
+
+    This endpoint serves DeepZoom tiles so that viewers only download the
+    visible part of large images. Level `0` is a single pixel and every level
+    doubles the size, up to the original resolution. Tiles are rendered a
+    level at a time on first access and then served from the disk cache.
+
+    Example:
+    ```
+    GET /images/{image_id}/tiles/{level}/{x}_{y}.jpg
+    ```
+
+    __Status Codes:__
+    - 200 OK: Successful retrieval of the tile.
+    - 403 Forbidden: Authentication required.
+    - 404 Not Found: Image or tile not found.
+
+    __Authorization__:
+    - All authenticated users can view any image.
+
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        responses={
+            (200, "image/jpeg"): OpenApiResponse(
+                OpenApiTypes.BINARY, description="JPEG tile."
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        cache = get_tile_cache()
+        pyramid = self.get_pyramid(cache)
+        level, x, y = kwargs["level"], kwargs["x"], kwargs["y"]
+
+        if not pyramid.has_tile(level, x, y):
+            raise NotFound("Tile not found.")
+        try:
+            tile = open(cache.tile_path(pyramid, level, x, y), "rb")
+        except FileNotFoundError:
+            # The level was evicted in the meantime, render it again
+            tile = open(cache.tile_path(pyramid, level, x, y), "rb")
+
+        response = FileResponse(tile, content_type="image/jpeg")
+        response["Cache-Control"] = "private, max-age=86400"
+        return response
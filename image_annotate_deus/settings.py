@@ -39,11 +39,13 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "rest_framework",
+    "rest_framework.authtoken",
     "annotations",
     "drf_spectacular",
 ]
 
 MIDDLEWARE = [
+    "annotations.middleware.TrafficCaptureMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -85,8 +87,12 @@ DATABASES = {
 }
 
 REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "annotations.authentication.CachedTokenAuthentication",
+    ],
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        "annotations.renderers.ORJSONRenderer",
     ],
     "DEFAULT_PARSER_CLASSES": (
         "rest_framework.parsers.FormParser",
@@ -96,11 +102,60 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+# Annotator used for new images, see annotations.annotators. The CPU
+# classifier is "annotations.annotators.HistogramAnnotator" with e.g.
+# {"batch_size": 32, "workers": 4} as OPTIONS; it leaves uploads queued for
+# manage.py annotate_images instead of annotating them during the request.
+ANNOTATION_BACKEND = {
+    "BACKEND": "annotations.annotators.RandomAnnotator",
+    "OPTIONS": {},
+}
+
+# Annotation throughput and other annotations logs go to the console
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "annotations": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# Upload admission control, see annotations.admission. The token buckets are
+# kept in a SQLite file shared by all worker processes on the host.
+UPLOAD_ADMISSION = {
+    "STORE_PATH": os.path.join(BASE_DIR, "admission.sqlite3"),
+    "USER_RATE": "60/min",
+    "USER_BURST": 10,
+    "GLOBAL_RATE": "600/min",
+    "GLOBAL_BURST": 100,
+    "MAX_QUEUED": 1000,
+    "MAX_QUEUED_PER_USER": 100,
+    "QUEUE_RETRY_AFTER": 30,  # seconds
+    "PRUNE_INTERVAL": 300,  # seconds between deleting refilled buckets
+}
+
+# Request capture for manage.py replay_traffic, see annotations.middleware
+TRAFFIC_CAPTURE = {
+    "ENABLED": False,
+    "PATH": os.path.join(BASE_DIR, "traffic.jsonl"),
+    "MAX_BODY": 65536,  # largest JSON body whose redacted shape is kept
+}
+
+# Resolved API tokens are cached in each process, see annotations.authentication
+TOKEN_AUTH_CACHE_SIZE = 1024
+TOKEN_AUTH_CACHE_TTL = 30  # seconds, how long other processes accept a revoked token
+
 SPECTACULAR_SETTINGS = {
     "SCHEMA_PATH_FUNC": "path.to.drf_spectacular.CustomAutoSchema",
     "TITLE": "Image Annotation API",
     "DESCRIPTION": "API for image annotation",
     "VERSION": "1.0.0",
+    "ENUM_NAME_OVERRIDES": {
+        "AnnotationEnum": "annotations.models.Annotation.EXISTING_ANNOTATIONS",
+    },
 }
 
 
@@ -146,3 +201,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 # URL that handles the media served from MEDIA_ROOT
 MEDIA_URL = "/media/"
+
+# DeepZoom tiles are rendered on demand and cached here, see annotations.tiles
+TILE_CACHE_ROOT = os.path.join(BASE_DIR, "tile_cache")
+TILE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+TILE_SIZE = 254
+TILE_OVERLAP = 1
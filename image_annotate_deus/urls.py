@@ -25,7 +25,16 @@ from annotations.views import (
     ImageDeleteView,
     CommentDeleteView,
     AdminImageDeleteView,
+    TokenRevokeView,
+    TokenCacheStatsView,
+    ImageTileDescriptorView,
+    ImageTileView,
+    BulkAnnotationView,
+    CommentTrendView,
+    ImageCommentTrendView,
+    UserStatsView,
 )
+from rest_framework.authtoken.views import obtain_auth_token
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
@@ -37,7 +46,22 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("images/", ImageListView.as_view(), name="image-list"),
     path("images/create/", ImageCreateView.as_view(), name="image-create"),
+    path(
+        "images/annotations/bulk/",
+        BulkAnnotationView.as_view(),
+        name="image-annotations-bulk",
+    ),
     path("images/<int:pk>/", ImageDetailView.as_view(), name="image-detail"),
+    path(
+        "images/<int:pk>/tiles.dzi",
+        ImageTileDescriptorView.as_view(),
+        name="image-tile-descriptor",
+    ),
+    path(
+        "images/<int:pk>/tiles/<int:level>/<int:x>_<int:y>.jpg",
+        ImageTileView.as_view(),
+        name="image-tile",
+    ),
     path(
         "images/<int:image_id>/admin/",
         AdminImageDeleteView.as_view(),
@@ -48,6 +72,12 @@ urlpatterns = [
         CommentCreateView.as_view(),
         name="comment-create",
     ),
+    path(
+        "images/<int:image_id>/comments/trends/",
+        ImageCommentTrendView.as_view(),
+        name="image-comment-trends",
+    ),
+    path("comments/trends/", CommentTrendView.as_view(), name="comment-trends"),
     path(
         "images/<int:image_id>/delete/",
         ImageDeleteView.as_view(),
@@ -59,6 +89,10 @@ urlpatterns = [
         name="comment-delete",
     ),
     path("user/images/", UserImagesListView.as_view(), name="user-images-list"),
+    path("user/stats/", UserStatsView.as_view(), name="user-stats"),
+    path("api/token/", obtain_auth_token, name="token-obtain"),
+    path("api/token/revoke/", TokenRevokeView.as_view(), name="token-revoke"),
+    path("api/token/cache/", TokenCacheStatsView.as_view(), name="token-cache-stats"),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path(
         "api/schema/swagger-ui/",